@@ -1,8 +1,9 @@
 from django.contrib import admin
-from github.models import Project, Blob, Commit
+from github.models import Project, Blob, BlobContent, Commit, SyncJob, SyncLease, \
+    SyncLeaseHeld
 
 class ProjectAdmin(admin.ModelAdmin):
-    list_display = ('title', 'github_repo',)
+    list_display = ('title', 'github_repo', 'commit_rate', 'next_poll')
     list_filter   = ('created',)
     search_fields = ('title', 'description')
     
@@ -10,10 +11,23 @@ class ProjectAdmin(admin.ModelAdmin):
     
     def fetch_github(self, request, queryset):
         updated = []
+        busy = []
+        failed = []
         for project in queryset:
-            if project.fetch_github():
-                updated.append(project.title)
-        self.message_user(request, "%s successfully updated." % ', '.join(updated))
+            try:
+                with SyncLease.objects.hold(project):
+                    if project.fetch_github():
+                        updated.append(project.title)
+            except SyncLeaseHeld:
+                busy.append(project.title)
+            except ValueError:
+                failed.append(project.title)
+        message = "%s successfully updated." % ', '.join(updated)
+        if busy:
+            message += " %s skipped, being synced by another worker." % ', '.join(busy)
+        if failed:
+            message += " %s could not be fetched from Github." % ', '.join(failed)
+        self.message_user(request, message)
     fetch_github.short_description = 'Fetch from Github'
 
 class CommitAdmin(admin.ModelAdmin):
@@ -31,15 +45,37 @@ class CommitAdmin(admin.ModelAdmin):
 
     def fetch_blobs(self, request, queryset):
         fetched = []
+        busy = []
         for commit in queryset:
-            if commit.fetch_blobs():
-                fetched.append(commit.sha)
-        self.message_user(request, 'Successfully fetched blobs for %s' % (', '.join(fetched)))
+            try:
+                with SyncLease.objects.hold(commit.project):
+                    if commit.fetch_blobs():
+                        fetched.append(commit.sha)
+            except SyncLeaseHeld:
+                busy.append(commit.sha)
+        message = 'Successfully fetched blobs for %s' % (', '.join(fetched))
+        if busy:
+            message += '. %s skipped, being synced by another worker.' % ', '.join(busy)
+        self.message_user(request, message)
     fetch_blobs.short_description = 'Fetch blobs for commits'
 
 class BlobAdmin(admin.ModelAdmin):
     pass
 
+class BlobContentAdmin(admin.ModelAdmin):
+    list_display = ('sha', 'mime_type', 'size')
+    search_fields = ('sha',)
+
+class SyncJobAdmin(admin.ModelAdmin):
+    list_display = ('project', 'status', 'requests', 'created', 'started', 'finished')
+    list_filter = ('status',)
+
+class SyncLeaseAdmin(admin.ModelAdmin):
+    list_display = ('project', 'owner', 'acquired', 'expires')
+
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(Commit, CommitAdmin)
 admin.site.register(Blob, BlobAdmin)
+admin.site.register(BlobContent, BlobContentAdmin)
+admin.site.register(SyncJob, SyncJobAdmin)
+admin.site.register(SyncLease, SyncLeaseAdmin)
@@ -0,0 +1,131 @@
+import cPickle as pickle
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5
+
+
+class ResponseCache(object):
+    """
+    Stores API responses along with their ETag / Last-Modified validators
+
+    Recently used entries are held in a bounded in-memory LRU; every entry is
+    also written to ``path`` (when given) so validators survive between runs.
+    Entries are dicts with ``etag``, ``last_modified`` and ``body`` keys.
+    
+    Every ``prune_every`` writes, files on disk not used for ``max_age``
+    seconds are deleted, then the least recently used past ``max_files``.
+    """
+    def __init__(self, path=None, max_entries=500, max_files=5000, max_age=60 * 60 * 24 * 7,
+                 prune_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.max_age = max_age
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._writes = 0
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        return os.path.join(self.path, md5(key).hexdigest())
+
+    def _remember(self, key, entry):
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        finally:
+            self._lock.release()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                return entry
+        finally:
+            self._lock.release()
+
+        if not self.path:
+            return None
+        filename = self._filename(key)
+        try:
+            fh = open(filename, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                entry = pickle.load(fh)
+            except Exception:
+                return None
+        finally:
+            fh.close()
+        try:
+            # the modification time tracks use, for pruning
+            os.utime(filename, None)
+        except OSError:
+            pass
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self._remember(key, entry)
+        if not self.path:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        fh = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump(entry, fh, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fh.close()
+        os.rename(tmp, self._filename(key))
+        
+        self._lock.acquire()
+        try:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        finally:
+            self._lock.release()
+        if prune:
+            self.prune()
+    
+    def prune(self):
+        """
+        Delete the files on disk past ``max_age`` or ``max_files``, returning
+        how many were deleted
+        """
+        if not self.path:
+            return 0
+        files = []
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            try:
+                files.append((os.path.getmtime(filename), filename))
+            except OSError:
+                continue
+        files.sort(reverse=True)
+        cutoff = self.max_age and time.time() - self.max_age
+        deleted = 0
+        for index, (mtime, filename) in enumerate(files):
+            if (self.max_files and index >= self.max_files) or (cutoff and mtime < cutoff):
+                try:
+                    os.remove(filename)
+                    deleted += 1
+                except OSError:
+                    pass
+        return deleted
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
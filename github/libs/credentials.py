@@ -0,0 +1,78 @@
+import threading
+import time
+
+from ratelimit import LocalBackend, TokenBucket
+
+class Credential(object):
+    """
+    One account's login and token, with a rate limiter of its own
+    """
+    def __init__(self, username, token, limiter=None):
+        self.username = username
+        self.token = token
+        self.limiter = limiter or TokenBucket(key='github-ratelimit:%s' % username)
+        self.disabled_until = 0
+
+    def __repr__(self):
+        return '<Credential: %s>' % self.username
+
+class CredentialPool(object):
+    """
+    Several accounts shared by one GithubAPI, so that throughput grows with
+    the number of accounts.  Each call goes through the account with the
+    most headroom: one that may call right away, preferring the most quota
+    left as last reported by GitHub.  An account whose token is refused
+    (401, or 403 with quota left) is taken out of rotation for ``cooldown``
+    seconds; an exhausted quota is left to that account's rate limiter.
+    """
+    def __init__(self, credentials, cooldown=300):
+        self.credentials = list(credentials)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pairs(cls, pairs, rate, burst, backend=None, cooldown=300):
+        """
+        A pool for a list of ``(username, token)`` pairs, each with its own
+        TokenBucket at ``rate`` and ``burst`` keyed by username, so a shared
+        backend keeps a budget per account
+        """
+        backend = backend or LocalBackend()
+        return cls([Credential(username, token,
+                               TokenBucket(rate, burst, backend, 'github-ratelimit:%s' % username))
+                    for username, token in pairs], cooldown)
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def choose(self):
+        """
+        The account to make the next call with
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            enabled = [c for c in self.credentials if c.disabled_until <= now]
+            if not enabled:
+                # every token was refused recently; try the first to recover
+                return min(self.credentials, key=lambda c: c.disabled_until)
+        finally:
+            self._lock.release()
+        def headroom(credential):
+            wait, remaining = credential.limiter.headroom()
+            return (wait, remaining is None and -1e9 or -remaining)
+        return min(enabled, key=headroom)
+
+    def failed(self, credential, status, headers):
+        """
+        Record a 401 or 403 answer to a call made with ``credential``,
+        returning True if the account was taken out of rotation
+        """
+        if status == 403 and headers.get('x-ratelimit-remaining') == '0':
+            return False
+        self._lock.acquire()
+        try:
+            credential.disabled_until = time.time() + self.cooldown
+        finally:
+            self._lock.release()
+        return True
@@ -0,0 +1,427 @@
+"""
+A stand-in for the parts of GitHub's v2 API that GithubAPI uses, serving
+synthetic repositories from memory.  Used by the benchmark_github command
+and handy for working offline:
+
+    hub = FakeHub(latency=0.05)
+    hub.add_repo('django-github', FakeRepo(files=200, depth=2, commits=100))
+    hub.start()
+    client = GithubAPI('coleifer', '', api_root=hub.api_root,
+                       gist_root=hub.gist_root, archive_root=hub.archive_root)
+    ...
+    hub.stop()
+"""
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+import datetime
+import random
+import re
+import tarfile
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from cStringIO import StringIO
+from SocketServer import ThreadingMixIn
+from hashlib import md5, sha1
+from urlparse import parse_qs, urlparse
+
+from gitobjects import blob_sha, tree_sha
+
+COMMITS_PER_PAGE = 35
+
+class FakeRepo(object):
+    """
+    A synthetic repository of ``files`` files of about ``file_size`` bytes,
+    spread over directories nested ``depth`` levels deep, with ``commits``
+    commits each changing ``changes`` files.  About a ``binary`` fraction of
+    the files are PNG images, the rest text.  The same ``seed``
+    always builds the same repository.  Blob and tree shas are computed as
+    git does.
+    """
+    def __init__(self, files=100, depth=2, commits=50, file_size=2048, changes=3,
+                 fanout=4, binary=0.1, seed=0, owner='coleifer'):
+        self.file_size = file_size
+        self.changes = changes
+        self.owner = owner
+        self.random = random.Random(seed)
+        self.trees = {}
+        self.blobs = {}
+        self.commits = []
+        self.revisions = {}
+        self.paths = []
+        for i in range(files):
+            parts = ['dir%d' % self.random.randint(0, fanout - 1)
+                     for level in range(self.random.randint(0, depth))]
+            extension = self.random.random() < binary and 'png' or 'txt'
+            self.paths.append('/'.join(parts + ['file%d.%s' % (i, extension)]))
+        for i in range(commits):
+            self.commit()
+
+    def content(self, path, revision):
+        if path.endswith('.png'):
+            # incompressible bytes that are not UTF-8 and hold NULs
+            data = '\x89PNG\r\n\x1a\n\0\0\0\rIHDR'
+            while len(data) < self.file_size:
+                data += sha1('%s %d %d' % (path, revision, len(data))).digest()
+            return data
+        line = '%s revision %d\n' % (path, revision)
+        return line * max(self.file_size / len(line), 1)
+
+    def build_tree(self, paths):
+        """
+        Store the tree holding ``paths`` (a dict of relative path to
+        revision) and everything below it, returning its sha
+        """
+        files, subdirs = {}, {}
+        for path, revision in paths.items():
+            if '/' in path:
+                head, rest = path.split('/', 1)
+                subdirs.setdefault(head, {})[rest] = revision
+            else:
+                files[path] = revision
+        entries = []
+        for name, sub in subdirs.items():
+            entries.append({'name': name, 'sha': self.build_tree(sub),
+                            'mode': '040000', 'type': 'tree'})
+        blobs = []
+        for name, revision in files.items():
+            data = self.content(name, revision)
+            blob = {'name': name, 'sha': blob_sha(data), 'size': len(data),
+                    'mode': '100644', 'data': data,
+                    'mime_type': name.endswith('.png') and 'image/png' or 'text/plain'}
+            blobs.append(blob)
+            entries.append({'name': name, 'sha': blob['sha'], 'mode': '100644',
+                            'type': 'blob'})
+        entries.sort(key=lambda e: e['name'])
+        sha = tree_sha([(e['mode'], e['name'], e['sha']) for e in entries])
+        self.trees[sha] = entries
+        for blob in blobs:
+            self.blobs[(sha, blob['name'])] = blob
+        return sha
+
+    def walk(self, tree, path=''):
+        """
+        Yield ``(path, blob)`` for every file below ``tree``
+        """
+        for entry in self.trees[tree]:
+            if entry['type'] == 'tree':
+                for item in self.walk(entry['sha'], path + entry['name'] + '/'):
+                    yield item
+            else:
+                yield path + entry['name'], self.blobs[(tree, entry['name'])]
+
+    def commit(self, changes=None, message=None):
+        """
+        Add a commit changing ``changes`` random files (all of them for the
+        first commit) and return its sha
+        """
+        if self.commits:
+            changed = self.random.sample(self.paths, min(changes or self.changes,
+                                                         len(self.paths)))
+        else:
+            changed = list(self.paths)
+        for path in changed:
+            self.revisions[path] = self.revisions.get(path, 0) + 1
+        tree = self.build_tree(self.revisions)
+        number = len(self.commits)
+        date = datetime.datetime(2010, 1, 1) + datetime.timedelta(hours=number)
+        date = date.strftime('%Y-%m-%dT%H:%M:%S-08:00')
+        sha = sha1('%s %d' % (tree, number)).hexdigest()
+        person = {'name': self.owner, 'login': self.owner,
+                  'email': '%s@example.com' % self.owner}
+        self.commits.insert(0, {
+            'id': sha,
+            'tree': tree,
+            'message': message or 'Commit %d' % number,
+            'url': '/commit/%s' % sha,
+            'parents': self.commits and [{'id': self.commits[0]['id']}] or [],
+            'author': person,
+            'committer': person,
+            'authored_date': date,
+            'committed_date': date,
+            'modified': [{'filename': path} for path in changed],
+        })
+        return sha
+
+class FakeHubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # concurrent clients open many connections at once
+    request_queue_size = 128
+
+class FakeHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        hub = self.server.hub
+        if hub.latency or hub.jitter:
+            time.sleep(hub.latency + random.random() * hub.jitter)
+        url = urlparse(self.path)
+        if method == 'POST':
+            length = int(self.headers.get('content-length', 0))
+            params = parse_qs(self.rfile.read(length))
+        else:
+            params = parse_qs(url.query)
+        params = dict((k, v[0]) for k, v in params.items())
+        status, headers = hub.authorize(params)
+        if status:
+            endpoint, body = 'refused', simplejson.dumps({'error': 'Refused'})
+        else:
+            endpoint, status, extra, body = hub.dispatch(method, url.path, params)
+            headers.update(extra)
+
+        etag = '"%s"' % md5(body).hexdigest()
+        if status == 200 and method == 'GET':
+            if self.headers.get('if-none-match') == etag:
+                status, body = 304, ''
+            headers['ETag'] = etag
+        hub.record(endpoint, status, len(body))
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeHub(object):
+    """
+    Serves the repositories added with ``add_repo`` on a local port, waiting
+    ``latency`` seconds (plus up to ``jitter`` more) before each response.
+    GET responses carry an ETag and answer If-None-Match with a 304.  The
+    owner part of API URLs is ignored; repositories are found by name.
+
+    Requests are counted by endpoint in ``requests``, with the bytes sent
+    in ``bytes``.
+
+    With a ``quota``, each token may make that many calls, reported in
+    X-RateLimit headers, before getting 403s.  Tokens in ``refused_tokens``
+    get 401s.
+    """
+    routes = (
+        ('user', re.compile(r'^/api/v2/json/user/show/([^/]+)/?$')),
+        ('followers', re.compile(r'^/api/v2/json/user/show/([^/]+)/followers/?$')),
+        ('following', re.compile(r'^/api/v2/json/user/show/([^/]+)/following/?$')),
+        ('watched', re.compile(r'^/api/v2/json/repos/watched/([^/]+)/?$')),
+        ('repos', re.compile(r'^/api/v2/json/repos/show/([^/]+)/?$')),
+        ('repo', re.compile(r'^/api/v2/json/repos/show/([^/]+)/([^/]+)/?$')),
+        ('commits', re.compile(r'^/api/v2/json/commits/list/([^/]+)/([^/]+)/([^/]+)(?:/(.+))?$')),
+        ('commit', re.compile(r'^/api/v2/json/commits/show/([^/]+)/([^/]+)/([0-9a-f]+)$')),
+        ('tree', re.compile(r'^/api/v2/json/tree/show/([^/]+)/([^/]+)/([0-9a-f]+)$')),
+        ('blob', re.compile(r'^/api/v2/json/blob/show/([^/]+)/([^/]+)/([0-9a-f]+)/(.+)$')),
+        ('tarball', re.compile(r'^/archive/([^/]+)/([^/]+)/tarball/([0-9a-f]+)$')),
+        ('gist_create', re.compile(r'^/gist/gists$')),
+        ('gist', re.compile(r'^/gist/(\d+)(\.txt)?$')),
+    )
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, jitter=0, quota=None,
+                 refused_tokens=()):
+        self.host = host
+        self.port = port
+        self.quota = quota
+        self.refused_tokens = set(refused_tokens)
+        self.usage = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.repos = {}
+        self.gists = {}
+        self.requests = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def api_root(self):
+        return 'http://%s:%d/api/v2/json' % (self.host, self.port)
+
+    @property
+    def gist_root(self):
+        return 'http://%s:%d/gist' % (self.host, self.port)
+
+    @property
+    def archive_root(self):
+        return 'http://%s:%d/archive' % (self.host, self.port)
+
+    @property
+    def calls(self):
+        return sum(self.requests.values())
+
+    def add_repo(self, name, repo):
+        self.repos[name] = repo
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.requests = {}
+            self.bytes = 0
+        finally:
+            self._lock.release()
+
+    def authorize(self, params):
+        """
+        (status to refuse the call with or None, quota headers) for the
+        token in ``params``
+        """
+        token = params.get('token', '')
+        if token in self.refused_tokens:
+            return 401, {}
+        if self.quota is None:
+            return None, {}
+        self._lock.acquire()
+        try:
+            used = self.usage[token] = self.usage.get(token, 0) + 1
+        finally:
+            self._lock.release()
+        headers = {'X-RateLimit-Limit': str(self.quota),
+                   'X-RateLimit-Remaining': str(max(self.quota - used, 0))}
+        if used > self.quota:
+            return 403, headers
+        return None, headers
+
+    def record(self, endpoint, status, size):
+        self._lock.acquire()
+        try:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes += size
+        finally:
+            self._lock.release()
+
+    def start(self):
+        self._server = FakeHubServer((self.host, self.port), FakeHubHandler)
+        self._server.hub = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def dispatch(self, method, path, params):
+        """
+        (endpoint, status, headers, body) for a request
+        """
+        for endpoint, pattern in self.routes:
+            match = pattern.match(path)
+            if match:
+                result = getattr(self, 'serve_%s' % endpoint)(params, *match.groups())
+                if result is None:
+                    return endpoint, 404, {}, simplejson.dumps({'error': 'Not Found'})
+                if isinstance(result, tuple):
+                    status, headers, body = result
+                    return endpoint, status, headers, body
+                return endpoint, 200, {'Content-Type': 'application/json'}, \
+                    simplejson.dumps(result)
+        return None, 404, {}, simplejson.dumps({'error': 'Not Found'})
+
+    def repo_data(self, owner, name):
+        return {'name': name, 'owner': owner, 'description': 'Synthetic repository',
+                'url': 'http://github.com/%s/%s' % (owner, name), 'homepage': '',
+                'watchers': 1, 'forks': 0, 'fork': False, 'private': False,
+                'open_issues': 0}
+
+    def serve_user(self, params, login):
+        return {'user': {'id': 1, 'login': login, 'name': login, 'company': '',
+                         'location': '', 'email': '%s@example.com' % login,
+                         'blog': '', 'following_count': 0, 'followers_count': 0,
+                         'public_gist_count': len(self.gists),
+                         'public_repo_count': len(self.repos)}}
+
+    def serve_followers(self, params, login):
+        return {'users': []}
+
+    def serve_following(self, params, login):
+        return {'users': []}
+
+    def serve_watched(self, params, login):
+        return self.serve_repos(params, login)
+
+    def serve_repos(self, params, owner):
+        return {'repositories': [self.repo_data(owner, name) for name in sorted(self.repos)]}
+
+    def serve_repo(self, params, owner, name):
+        if name not in self.repos:
+            return None
+        return {'repository': self.repo_data(owner, name)}
+
+    def serve_commits(self, params, owner, name, branch, path=None):
+        if name not in self.repos:
+            return None
+        commits = self.repos[name].commits
+        if path:
+            commits = [c for c in commits
+                       if path in [m['filename'] for m in c['modified']]]
+        page = int(params.get('page', 1))
+        return {'commits': commits[(page - 1) * COMMITS_PER_PAGE:page * COMMITS_PER_PAGE]}
+
+    def serve_commit(self, params, owner, name, sha):
+        if name not in self.repos:
+            return None
+        for commit in self.repos[name].commits:
+            if commit['id'] == sha:
+                return {'commit': commit}
+
+    def serve_tree(self, params, owner, name, sha):
+        if name not in self.repos or sha not in self.repos[name].trees:
+            return None
+        return {'tree': self.repos[name].trees[sha]}
+
+    def serve_blob(self, params, owner, name, tree, file_path):
+        if name not in self.repos:
+            return None
+        blob = self.repos[name].blobs.get((tree, file_path))
+        if blob is None:
+            return None
+        if blob['mime_type'] != 'text/plain':
+            # JSON has no bytes, so binary data goes out one char per byte
+            blob = dict(blob, data=blob['data'].decode('latin-1'))
+        return {'blob': blob}
+
+    def serve_tarball(self, params, owner, name, sha):
+        if name not in self.repos:
+            return None
+        repo = self.repos[name]
+        commits = [c for c in repo.commits if c['id'] == sha]
+        if not commits:
+            return None
+        # laid out as GitHub does, under a directory named after the commit
+        prefix = '%s-%s-%s/' % (owner, name, sha[:7])
+        buf = StringIO()
+        archive = tarfile.open(mode='w:gz', fileobj=buf)
+        for path, blob in repo.walk(commits[0]['tree']):
+            info = tarfile.TarInfo(prefix + path)
+            info.size = len(blob['data'])
+            info.mode = 0644
+            archive.addfile(info, StringIO(blob['data']))
+        archive.close()
+        return 200, {'Content-Type': 'application/x-gzip'}, buf.getvalue()
+
+    def serve_gist_create(self, params):
+        self._lock.acquire()
+        try:
+            gist_id = str(len(self.gists) + 1)
+            self.gists[gist_id] = params.get('file_contents[gistfile1]', '')
+        finally:
+            self._lock.release()
+        return 302, {'Location': '%s/%s' % (self.gist_root, gist_id)}, ''
+
+    def serve_gist(self, params, gist_id, txt=None):
+        if gist_id not in self.gists:
+            return None
+        return 200, {'Content-Type': 'text/plain'}, self.gists[gist_id]
@@ -0,0 +1,167 @@
+import Queue
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+# the GithubAPI methods mirrored by ConcurrentGithubAPI
+METHODS = (
+    'get_user', 'authenticate', 'followers', 'following', 'watching',
+    'get_repo', 'get_repos', 'get_commits', 'get_commit', 'get_tree',
+    'get_blob', 'create_gist', 'get_gist',
+)
+
+class Future(object):
+    """
+    The pending result of a call made by ConcurrentGithubAPI
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._exc_info = None
+
+    def _set(self, value, exc_info=None):
+        self._value = value
+        self._exc_info = exc_info
+        self._event.set()
+
+    def done(self):
+        return self._event.isSet()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to finish and return its result, raising whatever
+        it raised
+        """
+        self._event.wait(timeout)
+        if not self._event.isSet():
+            raise RuntimeError('Call still running after %s seconds' % timeout)
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+class ConcurrentGithubAPI(object):
+    """
+    Non-blocking front for a GithubAPI, for fetching many trees or blobs at
+    once.  Every GithubAPI method is mirrored and returns a Future at once;
+    the call itself runs on one of ``concurrency`` threads through the
+    wrapped client, so responses are processed by the same code and the
+    client's rate limiter, response cache, stats and connection pool are
+    shared.  Raise the pool size to match ``concurrency`` or calls will
+    queue for connections.
+
+    A semaphore bounds the calls in flight: once ``concurrency`` are
+    running, starting another blocks until one finishes.  Calls count
+    towards the counter of the thread that started them.
+
+    ``map`` and ``imap_unordered`` are blocking wrappers for bulk fetches:
+
+        api = ConcurrentGithubAPI(github_client, 16)
+        try:
+            trees = api.map('get_tree', [(login, repo, sha) for sha in shas])
+        finally:
+            api.close()
+    """
+    def __init__(self, client, concurrency=8):
+        self.client = client
+        self.concurrency = concurrency
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self._pool = ThreadPool(concurrency)
+
+    def close(self):
+        """
+        Wait for the calls in flight and stop the threads
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _start(self, func, args, kwargs, callback=None):
+        # the caller holds a slot of the semaphore, released when func returns
+        future = Future()
+        counter = self.client.get_counter()
+
+        def run():
+            self.client.set_counter(counter)
+            try:
+                try:
+                    future._set(func(*args, **kwargs))
+                except Exception:
+                    future._set(None, sys.exc_info())
+            finally:
+                self.client.set_counter(None)
+                self._semaphore.release()
+                if callback:
+                    callback(future)
+
+        self._pool.apply_async(run)
+        return future
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` on the pool, returning a Future
+        """
+        self._semaphore.acquire()
+        return self._start(func, args, kwargs)
+
+    def get_commit_pages(self, username, repo, pages, branch='master', optional_params={}):
+        """
+        Futures for pages 1 to ``pages`` of the commit history, fetched at
+        once rather than one after the other as ``iter_commits`` does
+        """
+        futures = []
+        for page in range(1, pages + 1):
+            params = dict(optional_params)
+            params['page'] = page
+            futures.append(self.get_commits(username, repo, branch, None, params))
+        return futures
+
+    def map(self, method, arg_list):
+        """
+        Call GithubAPI ``method`` with each tuple of arguments in
+        ``arg_list`` and return the results in the same order
+        """
+        func = getattr(self.client, method)
+        return [future.result() for future in [self.submit(func, *args) for args in arg_list]]
+
+    def imap_unordered(self, method, arg_list):
+        """
+        Like ``map``, but yield ``(index, result)`` pairs as calls finish,
+        ``index`` being the position of the arguments in ``arg_list``.  Calls
+        are only started as slots free up, so results can be handled while
+        the rest are being fetched.
+        """
+        func = getattr(self.client, method)
+        finished = Queue.Queue()
+        pending = 0
+        for index, args in enumerate(arg_list):
+            while not self._semaphore.acquire(False):
+                if not pending:
+                    # every slot is held by calls started elsewhere
+                    self._semaphore.acquire()
+                    break
+                index_done, future = finished.get()
+                pending -= 1
+                yield index_done, future.result()
+            self._start(func, args, {},
+                        lambda future, index=index: finished.put((index, future)))
+            pending += 1
+        while pending:
+            index_done, future = finished.get()
+            pending -= 1
+            yield index_done, future.result()
+
+def mirror(name):
+    def method(self, *args, **kwargs):
+        return self.submit(getattr(self.client, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = 'GithubAPI.%s, returning a Future' % name
+    return method
+
+for name in METHODS:
+    setattr(ConcurrentGithubAPI, name, mirror(name))
+del name
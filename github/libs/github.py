@@ -3,12 +3,18 @@ try:
 except ImportError:
     import json as simplejson
 import datetime
-import httplib2
 import re
 import socket
+import threading
 import time
+import urllib2
 from urllib import urlencode, quote
 
+from cache import ResponseCache
+from pool import ConnectionPool
+from ratelimit import TokenBucket
+from stats import Stats
+
 class GithubAPI(object):
     """
     A simple library for interacting with Github's v2 api
@@ -22,54 +28,173 @@ class GithubAPI(object):
     - get_repo(username, repo)
     - get_repos(username)
     - get_commits(username, repo, [branch])
+    - iter_commits(username, repo, [branch], [page])
     - get_commit(username, repo, sha)
     - get_tree(username, repo, sha)
     - get_blob(username, repo, sha, file_path)
+    - open_tarball(username, repo, sha)
     - create_gist(name, data, extension)
     - get_gist(gist_id)
+    
+    ``api_root``, ``gist_root`` and ``archive_root`` can point the client at
+    another server, such as the stand-in in ``fakehub``.  Every call is recorded in
+    ``stats``: latency per endpoint, bytes received, time spent waiting on
+    the rate limiter, response cache hits and misses, and errors.
+    
+    With a CredentialPool as ``credentials``, calls are spread over its
+    accounts, each with its own rate limiter, instead of being made as
+    ``username`` through ``limiter``.
+    
+    Responses of the endpoints in ``uncached_endpoints`` are never cached:
+    they are addressed by sha, so never change and are not asked for again
+    once stored.
     """
-    _fetched = 0
+    uncached_endpoints = ('commits/show', 'tree/show', 'blob/show')
     
-    def __init__(self, username=None, token=None):
+    def __init__(self, username=None, token=None, pool=None, limiter=None, cache=None,
+                 api_root='http://github.com/api/v2/json', gist_root='http://gist.github.com',
+                 stats=None, credentials=None, archive_root='http://github.com'):
+        self.archive_root = archive_root
+        self.credentials = credentials
+        self.stats = stats or Stats()
+        self.api_root = api_root
+        self.gist_root = gist_root
         self.username = username
         self.token = token
+        self.pool = pool or ConnectionPool()
+        self.limiter = limiter or TokenBucket()
+        self.cache = cache
+        self._local = threading.local()
     
-    def raw_api_call(self, url, parameters={}, http_method="GET", max_timeout=4):
+    def get_counter(self):
+        return getattr(self._local, 'counter', None)
+    
+    def set_counter(self, counter):
         """
-        Make an API Call to GitHub
+        Count the calls made from the current thread with ``counter``, or
+        stop counting if it is None
         """
-        # limit to 1 call per 1.15 seconds
-        if time.time() - self._fetched <= 1.15:
-            time.sleep(1.15 - (time.time() - self._fetched))
-        self._fetched = time.time()
+        self._local.counter = counter
+    
+    def endpoint(self, url):
+        """
+        The API method a URL calls, such as 'commits/list', for the stats
+        """
+        if url.startswith(self.api_root):
+            return '/'.join(url[len(self.api_root):].strip('/').split('/')[:2])
+        return 'gist'
+    
+    def account(self):
+        """
+        ``(credential, username, token, limiter)`` to make the next call
+        with, once the limiter allows it.  ``credential`` is None unless
+        calls are spread over a credential pool.
+        """
+        credential = self.credentials and self.credentials.choose()
+        if credential:
+            username, token, limiter = credential.username, credential.token, credential.limiter
+        else:
+            username, token, limiter = self.username, self.token, self.limiter
+        
+        slept = limiter.acquire()
+        if slept:
+            self.stats.incr('throttle.waits')
+            self.stats.incr('throttle.seconds', slept)
+        self.stats.incr('api.calls')
         
-        sock = httplib2.Http(timeout=max_timeout)
+        counter = self.get_counter()
+        if counter is not None:
+            counter.increment()
+        return credential, username, token, limiter
+    
+    def raw_api_call(self, url, parameters={}, http_method="GET", max_timeout=4):
+        """
+        Make an API Call to GitHub
         
+        GET responses are kept in the response cache, if one is configured,
+        and revalidated with If-None-Match / If-Modified-Since.  A 304 is
+        answered from the cache.
+        """
+        endpoint = self.endpoint(url)
         request_headers = { 'User-Agent': 'Python-httplib2' }
         
-        parameters.update({ 'username': self.username,
-                            'token': self.token })
+        cached = None
+        use_cache = http_method == 'GET' and self.cache is not None and \
+            endpoint not in self.uncached_endpoints
+        if use_cache:
+            cache_key = url
+            if parameters:
+                cache_key += '?%s' % urlencode(sorted(parameters.items()))
+            cached = self.cache.get(cache_key)
+            if cached:
+                if cached['etag']:
+                    request_headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    request_headers['If-Modified-Since'] = cached['last_modified']
         
-        if http_method == 'POST':
-            post_data = urlencode(parameters)
-        elif parameters:
-            url += '?%s' % urlencode(parameters)
-
-        try:
+        # a token that is refused is retried with the pool's other accounts
+        attempts = self.credentials and len(self.credentials) or 1
+        for attempt in range(attempts):
+            credential, username, token, limiter = self.account()
+            
+            call_parameters = dict(parameters)
+            call_parameters.update({ 'username': username,
+                                     'token': token })
+            
+            call_url = url
             if http_method == 'POST':
-                headers, response = sock.request(url, "POST", post_data, headers=request_headers)
-            else:
-                headers, response = sock.request(url)
-        except socket.timeout:
-            raise ValueError('Socket timed out')
-                
+                post_data = urlencode(call_parameters)
+            elif call_parameters:
+                call_url += '?%s' % urlencode(call_parameters)
+            
+            start = time.time()
+            try:
+                if http_method == 'POST':
+                    headers, response = self.pool.request(call_url, "POST", post_data,
+                        headers=request_headers, timeout=max_timeout)
+                else:
+                    headers, response = self.pool.request(call_url,
+                        headers=request_headers, timeout=max_timeout)
+            except socket.timeout:
+                self.stats.incr('api.errors')
+                self.stats.incr('api.errors.timeout')
+                raise ValueError('Socket timed out')
+            except Exception:
+                self.stats.incr('api.errors')
+                raise
+            finally:
+                self.stats.timing('api.%s' % endpoint, time.time() - start)
+            
+            limiter.update(headers)
+            self.stats.incr('api.bytes', len(response))
+            
+            if credential and int(headers.get('status', 200)) in (401, 403) and \
+                    self.credentials.failed(credential, int(headers['status']), headers):
+                self.stats.incr('credentials.refused')
+                continue
+            break
+        
         status = int(headers.pop('status', 200))
-        if status != 200:
+        if status == 304 and cached:
+            self.stats.incr('cache.hits')
+            response = cached['body']
+        elif status != 200:
+            self.stats.incr('api.errors')
+            self.stats.incr('api.errors.%s' % status)
             raise ValueError('Returned status: %s' % (status))
+        elif use_cache:
+            self.stats.incr('cache.misses')
+            etag, last_modified = headers.get('etag'), headers.get('last-modified')
+            if etag or last_modified:
+                self.cache.set(cache_key, { 'etag': etag,
+                                            'last_modified': last_modified,
+                                            'body': response })
         
         try:
             processed_response = simplejson.loads(response)
         except ValueError, e:
+            self.stats.incr('api.errors')
+            self.stats.incr('api.errors.json')
             raise ValueError('Error in data from GitHub API: %s' % e.message)
     
         return processed_response
@@ -108,6 +233,7 @@ class GithubAPI(object):
         """
         Thin wrapper for raw_api_call - fails silently
         """
+        params = dict(params)
         for (key, value) in optional_params.items():
             if not params.has_key(key):
                 params[key] = value
@@ -121,7 +247,7 @@ class GithubAPI(object):
     
     def get_user(self, username, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/user/show/%s' % (username),
+            url='%s/user/show/%s' % (self.api_root, username),
             processor=self.process_user,
             optional_params=optional_params
         )
@@ -131,41 +257,41 @@ class GithubAPI(object):
     
     def followers(self, username, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/user/show/%s/followers' % (username),
+            url='%s/user/show/%s/followers' % (self.api_root, username),
             processor=self.process_users,
             optional_params=optional_params
         )
     
     def following(self, username, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/user/show/%s/following' % (username),
+            url='%s/user/show/%s/following' % (self.api_root, username),
             processor=self.process_users,
             optional_params=optional_params
         )
     
     def watching(self, username, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/repos/watched/%s/' % (username),
+            url='%s/repos/watched/%s/' % (self.api_root, username),
             processor=self.process_repos,
             optional_params=optional_params
         )
     
     def get_repo(self, username, repo, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/repos/show/%s/%s' % (username, repo),
+            url='%s/repos/show/%s/%s' % (self.api_root, username, repo),
             processor=self.process_repo,
             optional_params=optional_params
         )
     
     def get_repos(self, username, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/repos/show/%s/' % (username),
+            url='%s/repos/show/%s/' % (self.api_root, username),
             processor=self.process_repos,
             optional_params=optional_params
         )
     
     def get_commits(self, username, repo, branch='master', file_path=None, optional_params={}):
-        url = 'http://github.com/api/v2/json/commits/list/%s/%s/%s' % (username, repo, branch)
+        url = '%s/commits/list/%s/%s/%s' % (self.api_root, username, repo, branch)
         if file_path:
             url='%s/%s' % (url, file_path)
         return self.api_call(
@@ -174,35 +300,82 @@ class GithubAPI(object):
             optional_params=optional_params
         )
     
+    def iter_commits(self, username, repo, branch='master', file_path=None, page=1,
+                     optional_params={}):
+        """
+        Yield ``(page, commits)`` for each page of history, newest first,
+        starting at ``page`` and stopping at the first empty page.  A page
+        that cannot be fetched raises ValueError, so that it is not taken
+        for the end of the history.
+        """
+        while True:
+            params = dict(optional_params)
+            params['page'] = page
+            commits = self.get_commits(username, repo, branch, file_path, params)
+            if commits is False:
+                raise ValueError('Could not fetch page %d of commits for %s/%s' % (
+                    page, username, repo))
+            if not commits:
+                return
+            yield page, commits
+            page += 1
+    
     def get_commit(self, username, repo, sha, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/commits/show/%s/%s/%s' % (username, repo, sha),
+            url='%s/commits/show/%s/%s/%s' % (self.api_root, username, repo, sha),
             processor=self.process_commit,
             optional_params=optional_params
         )
     
     def get_tree(self, username, repo, sha, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/tree/show/%s/%s/%s' % (username, repo, sha),
+            url='%s/tree/show/%s/%s/%s' % (self.api_root, username, repo, sha),
             processor=self.process_tree_data,
             optional_params=optional_params
         )
     
     def get_blob(self, username, repo, sha, file_path, optional_params={}):
         return self.api_call(
-            url='http://github.com/api/v2/json/blob/show/%s/%s/%s/%s' % (username, repo, sha, file_path),
+            url='%s/blob/show/%s/%s/%s/%s' % (self.api_root, username, repo, sha, file_path),
             processor=self.process_blob_data,
             optional_params=optional_params
         )
     
+    def open_tarball(self, username, repo, sha, max_timeout=30):
+        """
+        Open the gzipped tarball of the tree at commit ``sha``, returning a
+        file-like object to be read as a stream and closed by the caller.
+        The archive is fetched with urllib2 rather than the connection pool,
+        which would read it into memory whole.
+        """
+        credential, login, token, limiter = self.account()
+        url = '%s/%s/%s/tarball/%s?%s' % (self.archive_root, username, repo, sha,
+            urlencode({ 'login': login, 'token': token }))
+        request = urllib2.Request(url, headers={ 'User-Agent': 'Python-urllib2' })
+        start = time.time()
+        try:
+            response = urllib2.urlopen(request, timeout=max_timeout)
+        except urllib2.HTTPError, e:
+            self.stats.incr('api.errors')
+            self.stats.incr('api.errors.%s' % e.code)
+            if credential and e.code in (401, 403):
+                self.credentials.failed(credential, e.code, e.headers.dict)
+            raise ValueError('Returned status: %s' % e.code)
+        except (urllib2.URLError, socket.timeout), e:
+            self.stats.incr('api.errors')
+            raise ValueError('Error opening tarball: %s' % e)
+        finally:
+            self.stats.timing('api.tarball', time.time() - start)
+        limiter.update(response.info().dict)
+        return CountingReader(response, self.stats)
+    
     def create_gist(self, name, data, ext='.txt', optional_params={}, max_timeout=4):
         """
         This method needs improvement.  I've only been able to get it working
         by posting anonymously.  When I've added login & token to the post
         parameters, I get 401s.
         """
-        url = 'http://gist.github.com/gists'
-        sock = httplib2.Http(timeout=max_timeout)
+        url = '%s/gists' % self.gist_root
         
         request_headers = { 'User-Agent': 'Python-httplib2' }
         
@@ -216,7 +389,8 @@ class GithubAPI(object):
             qs += '%s=%s&' % (key, quote(value))
 
         try:
-            headers, response = sock.request(url, "POST", qs, headers=request_headers)
+            headers, response = self.pool.request(url, "POST", qs,
+                headers=request_headers, timeout=max_timeout)
         except socket.timeout:
             raise ValueError('Socket timed out')
         
@@ -225,16 +399,15 @@ class GithubAPI(object):
             raise ValueError('Returned status: %s' % (status))
         
         location = headers.pop('location')
-        sock.request(location)
+        self.pool.request(location, timeout=max_timeout)
         
-        matches = re.match('https?:\/\/gist\.github\.com\/(\d+)\/?', location)
+        matches = re.search('\/(\d+)\/?$', location)
         return matches.group(1)
     
     def get_gist(self, gist_id, max_timeout=4):
-        url = 'http://gist.github.com/%s.txt' % (gist_id)
-        sock = httplib2.Http(timeout=max_timeout)
+        url = '%s/%s.txt' % (self.gist_root, gist_id)
         try:
-            headers, response = sock.request(url)
+            headers, response = self.pool.request(url, timeout=max_timeout)
         except socket.timeout:
             raise ValueError('Socket timed out')
         
@@ -244,14 +417,114 @@ class GithubAPI(object):
         
         return response
 
+class CountingReader(object):
+    """
+    A response being streamed, counting the bytes read as ``api.bytes``
+    """
+    def __init__(self, response, stats):
+        self.response = response
+        self.stats = stats
+    
+    def read(self, size=-1):
+        data = self.response.read(size)
+        self.stats.incr('api.bytes', len(data))
+        return data
+    
+    def close(self):
+        self.response.close()
+
+class CallCounter(object):
+    """
+    Thread-safe count of API calls, see ``GithubAPI.set_counter``
+    """
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def increment(self):
+        self._lock.acquire()
+        try:
+            self.calls += 1
+        finally:
+            self._lock.release()
+
 def convert_github_timestamp(value):
-    return datetime.datetime(*time.strptime(value[:-6], '%Y-%m-%dT%H:%M:%S')[:6])
-        
+    """
+    Parse a timestamp such as '2010-01-01T10:00:00-08:00' into a naive
+    datetime, ignoring the UTC offset.  The fields sit at fixed positions,
+    so slicing them out is much cheaper than strptime, which is only used
+    for anything that does not fit the pattern.
+    """
+    try:
+        return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                 int(value[11:13]), int(value[14:16]), int(value[17:19]))
+    except ValueError:
+        return datetime.datetime(*time.strptime(value[:-6], '%Y-%m-%dT%H:%M:%S')[:6])
+
+class Field(object):
+    """
+    An attribute read from an API object's JSON data.  With ``decode``, the
+    value is decoded on first access and kept in the ``_decoded_<name>`` slot.
+    """
+    def __init__(self, name, decode=None):
+        self.name = name
+        self.decode = decode
+        self.slot = '_decoded_%s' % name
+    
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        if self.decode is None:
+            return obj._data.get(self.name)
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = obj._data.get(self.name)
+            if value is not None:
+                value = self.decode(value)
+            setattr(obj, self.slot, value)
+            return value
+    
+    def __set__(self, obj, value):
+        if self.decode is None:
+            obj._data[self.name] = value
+        else:
+            setattr(obj, self.slot, value)
+
+class APIObjectType(type):
+    """
+    Turns each of a class's ``pieces`` into a Field, decoded by the
+    matching function in ``decoders``, and gives the class ``__slots__``
+    so instances carry no ``__dict__``
+    """
+    def __new__(meta, name, bases, attrs):
+        decoders = attrs.get('decoders', {})
+        slots = list(attrs.get('__slots__', ()))
+        for piece in attrs.get('pieces', ()):
+            if piece not in attrs:
+                attrs[piece] = Field(piece, decoders.get(piece))
+                if piece in decoders:
+                    slots.append('_decoded_%s' % piece)
+        attrs['__slots__'] = tuple(slots)
+        return type.__new__(meta, name, bases, attrs)
+
 class GenericAPIObject(object):
+    """
+    A record over one object of parsed JSON.  Nothing is copied: fields are
+    read from the JSON when accessed, and decoded then if need be.
+    """
+    __metaclass__ = APIObjectType
+    __slots__ = ('_data',)
     pieces = []
+    decoders = {}
     def __init__(self, data):
-        for piece in self.pieces:
-            setattr(self, piece, data.get(piece))
+        self._data = data
+    
+    def __repr__(self):
+        for piece in ('id', 'sha', 'login', 'name'):
+            if piece in self.pieces:
+                return '<%s: %s>' % (self.__class__.__name__, self._data.get(piece))
+        return '<%s>' % self.__class__.__name__
 
 class GithubAPIUser(GenericAPIObject):
     pieces = ['id', 'login', 'name', 'company', 'location', 
@@ -265,10 +538,10 @@ class GithubAPIRepo(GenericAPIObject):
 class GithubAPICommit(GenericAPIObject):
     pieces = ['message', 'parents', 'url', 'author', 'id', 'committed_date',
               'authored_date', 'tree', 'committer']
-    def __init__(self, data):
-        super(GithubAPICommit, self).__init__(data)
-        self.committed_date = convert_github_timestamp(self.committed_date)
-        self.authored_date = convert_github_timestamp(self.authored_date)
+    decoders = {
+        'committed_date': convert_github_timestamp,
+        'authored_date': convert_github_timestamp,
+    }
 
 class GithubAPIObject(GenericAPIObject):
     pieces = ['name', 'sha', 'mode', 'type']
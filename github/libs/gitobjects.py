@@ -0,0 +1,21 @@
+from binascii import unhexlify
+from hashlib import sha1
+
+def blob_sha(data):
+    """
+    The git sha of a file holding ``data``
+    """
+    return sha1('blob %d\0%s' % (len(data), data)).hexdigest()
+
+def tree_sha(entries):
+    """
+    The git sha of a tree holding ``entries``, a list of ``(mode, name,
+    sha)`` with modes written as the API gives them ('100644', '040000')
+    """
+    def sort_key(entry):
+        # git orders a subtree as if its name ended with a slash
+        mode, name, sha = entry
+        return mode.lstrip('0') == '40000' and name + '/' or name
+    body = ''.join(['%s %s\0%s' % (mode.lstrip('0'), name, unhexlify(sha))
+                    for mode, name, sha in sorted(entries, key=sort_key)])
+    return sha1('tree %d\0%s' % (len(body), body)).hexdigest()
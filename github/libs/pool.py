@@ -0,0 +1,117 @@
+import threading
+import time
+from urlparse import urlparse
+
+import httplib2
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of persistent ``httplib2.Http`` objects, kept per host
+
+    httplib2 already reuses keep-alive connections, but a single ``Http``
+    object cannot be shared between threads.  The pool hands out one ``Http``
+    per caller and takes it back afterwards, so the TCP/TLS connection it
+    holds survives to the next request.
+
+    - pool_size: maximum number of connections open to any one host
+    - idle_timeout: seconds after which an unused connection is dropped
+    - timeout: socket timeout for new connections
+    """
+    def __init__(self, pool_size=4, idle_timeout=60, timeout=4):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+
+    def _key(self, url, timeout):
+        parsed = urlparse(url)
+        return (parsed.scheme, parsed.netloc, timeout or self.timeout)
+
+    def _slot(self, key):
+        self._lock.acquire()
+        try:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.pool_size)
+            return self._slots[key]
+        finally:
+            self._lock.release()
+
+    def _close(self, sock):
+        for conn in sock.connections.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        sock.connections.clear()
+
+    def acquire(self, url, timeout=None):
+        """
+        Return an ``Http`` for the host in ``url``, blocking while the host
+        already has ``pool_size`` connections checked out
+        """
+        key = self._key(url, timeout)
+        self._slot(key).acquire()
+
+        stale = []
+        sock = None
+        now = time.time()
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key, [])
+            while idle:
+                last_used, candidate = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    sock = candidate
+                    break
+                stale.append(candidate)
+        finally:
+            self._lock.release()
+
+        for candidate in stale:
+            self._close(candidate)
+
+        if sock is None:
+            sock = httplib2.Http(timeout=key[2])
+        return sock
+
+    def release(self, url, sock, timeout=None, discard=False):
+        """
+        Return an ``Http`` to the pool.  Pass ``discard=True`` if the request
+        failed and the underlying connection may be in a bad state.
+        """
+        key = self._key(url, timeout)
+        if discard:
+            self._close(sock)
+        else:
+            self._lock.acquire()
+            try:
+                self._idle.setdefault(key, []).append((time.time(), sock))
+            finally:
+                self._lock.release()
+        self._slot(key).release()
+
+    def request(self, url, method='GET', body=None, headers=None, timeout=None):
+        sock = self.acquire(url, timeout)
+        try:
+            result = sock.request(url, method, body, headers=headers)
+        except:
+            self.release(url, sock, timeout, discard=True)
+            raise
+        self.release(url, sock, timeout)
+        return result
+
+    def clear(self):
+        """
+        Close every idle connection
+        """
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for socks in idle.values():
+            for last_used, sock in socks:
+                self._close(sock)
@@ -0,0 +1,183 @@
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+import fcntl
+import os
+import tempfile
+import threading
+import time
+
+
+class LocalBackend(object):
+    """
+    Keeps limiter state in memory, shared by every thread in the process
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def update(self, key, func):
+        self._lock.acquire()
+        try:
+            state, result = func(self._states.get(key, {}))
+            self._states[key] = state
+            return result
+        finally:
+            self._lock.release()
+
+
+class FileBackend(object):
+    """
+    Keeps limiter state in a JSON file guarded by ``flock``, so that every
+    process on the machine draws from the same bucket
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'django-github-ratelimit')
+
+    def update(self, key, func):
+        fh = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0644), 'r+')
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            raw = fh.read()
+            try:
+                states = simplejson.loads(raw) if raw else {}
+            except ValueError:
+                states = {}
+            state, result = func(states.get(key, {}))
+            states[key] = state
+            fh.seek(0)
+            fh.truncate()
+            fh.write(simplejson.dumps(states))
+            fh.flush()
+            return result
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+            fh.close()
+
+
+class CacheBackend(object):
+    """
+    Keeps limiter state in the Django cache.  ``cache.add`` is used as a
+    mutex, so the cache must be one shared between processes (memcached,
+    database) for this to coordinate anything.
+    """
+    def __init__(self, cache=None, lock_timeout=5, timeout=3600):
+        if cache is None:
+            from django.core.cache import cache
+        self.cache = cache
+        self.lock_timeout = lock_timeout
+        self.timeout = timeout
+
+    def update(self, key, func):
+        lock_key = '%s:lock' % key
+        while not self.cache.add(lock_key, 1, self.lock_timeout):
+            time.sleep(0.01)
+        try:
+            state, result = func(self.cache.get(key) or {})
+            self.cache.set(key, state, self.timeout)
+            return result
+        finally:
+            self.cache.delete(lock_key)
+
+
+BACKENDS = {
+    'local': LocalBackend,
+    'file': FileBackend,
+    'cache': CacheBackend,
+}
+
+
+class TokenBucket(object):
+    """
+    Token-bucket rate limiter
+
+    Tokens refill at ``rate`` per second up to ``burst``, and every call takes
+    one.  The server's own view of the quota, read from the X-RateLimit
+    headers, overrides the bucket: once it reports nothing remaining, callers
+    wait for the reset.  State lives in a pluggable backend so that several
+    threads or processes can share one budget.
+    """
+    def __init__(self, rate=1 / 1.15, burst=5, backend=None, key='github-ratelimit',
+                 window=60):
+        self.rate = rate
+        self.burst = burst
+        self.backend = backend or LocalBackend()
+        self.key = key
+        self.window = window
+
+    def _take(self, state):
+        now = time.time()
+        tokens = state.get('tokens', self.burst)
+        stamp = state.get('stamp', now)
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        state['tokens'], state['stamp'] = tokens, now
+
+        remaining, reset = state.get('remaining'), state.get('reset')
+        if remaining is not None and reset is not None and reset <= now:
+            state['remaining'] = state['reset'] = remaining = None
+        if remaining is not None and remaining <= 0:
+            return state, reset - now
+
+        if tokens < 1:
+            return state, (1 - tokens) / self.rate
+
+        state['tokens'] = tokens - 1
+        if remaining is not None:
+            state['remaining'] = remaining - 1
+        return state, 0
+
+    def headroom(self):
+        """
+        ``(wait, remaining)`` without taking a token: the seconds until a
+        call may be made, and the server's last count of calls left in the
+        quota (None if unknown)
+        """
+        def _peek(state):
+            now = time.time()
+            tokens = state.get('tokens', self.burst)
+            stamp = state.get('stamp', now)
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            remaining, reset = state.get('remaining'), state.get('reset')
+            if remaining is not None and reset is not None and reset <= now:
+                remaining = None
+            if remaining is not None and remaining <= 0:
+                return state, (reset - now, 0)
+            if tokens < 1:
+                return state, ((1 - tokens) / self.rate, remaining)
+            return state, (0, remaining)
+        return self.backend.update(self.key, _peek)
+
+    def acquire(self):
+        """
+        Block until a call may be made, returning the seconds spent waiting
+        """
+        slept = 0
+        while True:
+            wait = self.backend.update(self.key, self._take)
+            if wait <= 0:
+                return slept
+            time.sleep(wait)
+            slept += wait
+
+    def update(self, headers):
+        """
+        Record the quota reported in a response's X-RateLimit headers
+        """
+        try:
+            remaining = int(headers['x-ratelimit-remaining'])
+        except (KeyError, ValueError):
+            return
+        try:
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            reset = None
+
+        def _record(state):
+            state['remaining'] = remaining
+            if reset is not None:
+                state['reset'] = reset
+            elif not state.get('reset'):
+                state['reset'] = time.time() + self.window
+            return state, None
+        self.backend.update(self.key, _record)
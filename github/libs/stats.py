@@ -0,0 +1,149 @@
+import threading
+import time
+from functools import wraps
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def new_timing():
+    return {'count': 0, 'total': 0.0, 'min': None, 'max': None,
+            'buckets': [0] * (len(BUCKETS) + 1)}
+
+def merge_timing(into, timing):
+    into['count'] += timing['count']
+    into['total'] += timing['total']
+    for key, pick in (('min', min), ('max', max)):
+        if into[key] is None:
+            into[key] = timing[key]
+        elif timing[key] is not None:
+            into[key] = pick(into[key], timing[key])
+    into['buckets'] = [a + b for a, b in zip(into['buckets'], timing['buckets'])]
+
+def merge_snapshots(into, snapshot):
+    """
+    Add the counters and timings of ``snapshot`` to ``into``, in place
+    """
+    if not into.get('since') or (snapshot.get('since') and snapshot['since'] < into['since']):
+        into['since'] = snapshot.get('since')
+    counters = into.setdefault('counters', {})
+    for name, value in snapshot.get('counters', {}).items():
+        counters[name] = counters.get(name, 0) + value
+    timings = into.setdefault('timings', {})
+    for name, timing in snapshot.get('timings', {}).items():
+        merge_timing(timings.setdefault(name, new_timing()), timing)
+    return into
+
+class Timer(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stats.timing(self.name, time.time() - self.start)
+        if exc_type is not None:
+            self.stats.incr('%s.errors' % self.name)
+
+class Stats(object):
+    """
+    Thread-safe counters and latency histograms.  Counters may be floats
+    (seconds slept, say); timings are kept as a count, total, min, max and
+    a histogram over BUCKETS.  ``snapshot()`` returns everything as plain
+    data that ``merge_snapshots`` can add up across processes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.since = time.time()
+            self.counters = {}
+            self.timings = {}
+        finally:
+            self._lock.release()
+
+    def incr(self, name, value=1):
+        self._lock.acquire()
+        try:
+            self.counters[name] = self.counters.get(name, 0) + value
+        finally:
+            self._lock.release()
+
+    def timing(self, name, seconds):
+        ms = seconds * 1000
+        bucket = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if ms <= bound:
+                bucket = i
+                break
+        self._lock.acquire()
+        try:
+            timing = self.timings.setdefault(name, new_timing())
+            timing['count'] += 1
+            timing['total'] += seconds
+            if timing['min'] is None or seconds < timing['min']:
+                timing['min'] = seconds
+            if timing['max'] is None or seconds > timing['max']:
+                timing['max'] = seconds
+            timing['buckets'][bucket] += 1
+        finally:
+            self._lock.release()
+
+    def timer(self, name):
+        """
+        A context manager recording the time spent in its block under
+        ``name``, and counting ``name.errors`` if the block raises
+        """
+        return Timer(self, name)
+
+    def timed(self, name):
+        """
+        Decorator recording each call of a function as ``timer(name)`` does
+        """
+        def decorator(func):
+            def inner(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wraps(func)(inner)
+        return decorator
+
+    def snapshot(self, reset=False):
+        self._lock.acquire()
+        try:
+            snapshot = {'since': self.since, 'buckets': list(BUCKETS),
+                        'counters': {}, 'timings': {}}
+            merge_snapshots(snapshot, {'counters': self.counters, 'timings': self.timings})
+            if reset:
+                self.since = time.time()
+                self.counters = {}
+                self.timings = {}
+            return snapshot
+        finally:
+            self._lock.release()
+
+def format_snapshot(snapshot):
+    """
+    The snapshot as lines of text: counters, then one line per timing with
+    its count, mean, min, max and total
+    """
+    lines = []
+    counters = snapshot.get('counters', {})
+    for name in sorted(counters):
+        lines.append('%-40s %14s' % (name, isinstance(counters[name], float)
+                                     and '%.3f' % counters[name] or counters[name]))
+    timings = snapshot.get('timings', {})
+    if timings:
+        lines.append('')
+        lines.append('%-40s %8s %10s %10s %10s %10s' % ('timing (ms)', 'count', 'mean',
+                                                       'min', 'max', 'total (s)'))
+    for name in sorted(timings):
+        t = timings[name]
+        lines.append('%-40s %8d %10.1f %10.1f %10.1f %10.2f' % (name, t['count'],
+            t['count'] and t['total'] * 1000 / t['count'] or 0, (t['min'] or 0) * 1000,
+            (t['max'] or 0) * 1000, t['total']))
+    return lines
@@ -0,0 +1,207 @@
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+import datetime
+import logging
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+from github.libs.cache import ResponseCache
+from github.libs.credentials import Credential, CredentialPool
+from github.libs.fakehub import FakeHub, FakeRepo
+from github.libs.pool import ConnectionPool
+from github.libs.ratelimit import TokenBucket
+from github.management.commands import fetch_github
+from github.models import Project, Blob, BlobContent, github_client, GITHUB_LOGIN, \
+    GITHUB_FETCH_MODE, GITHUB_FETCH_WORKERS
+from github.storage import FileSystemStorage, get_storage
+from github.utils import chunked
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--files', action='store', type='int', dest='files', default=200,
+            help='Number of files in each synthetic repository.'),
+        make_option('--depth', action='store', type='int', dest='depth', default=2,
+            help='How deeply directories are nested.'),
+        make_option('--commits', action='store', type='int', dest='commits', default=50,
+            help='Number of commits in each repository.'),
+        make_option('--file-size', action='store', type='int', dest='file_size', default=2048,
+            help='Approximate size of each file in bytes.'),
+        make_option('--changes', action='store', type='int', dest='changes', default=5,
+            help='Files changed by the commit pushed for the incremental sync.'),
+        make_option('--projects', action='store', type='int', dest='projects', default=4,
+            help='Number of projects synced by the fetch_github command run.'),
+        make_option('--workers', action='store', type='int', dest='workers',
+            default=GITHUB_FETCH_WORKERS,
+            help='Threads used by fetch_blobs and by the fetch_github command.'),
+        make_option('--latency', action='store', type='float', dest='latency', default=0,
+            help='Seconds the fake server waits before each response.'),
+        make_option('--rate', action='store', type='float', dest='rate', default=0,
+            help='API calls per second allowed to each account, default unlimited.'),
+        make_option('--tokens', action='store', type='int', dest='tokens', default=0,
+            help='Spread calls over a pool of this many accounts.'),
+        make_option('--mode', action='store', dest='mode', default=GITHUB_FETCH_MODE,
+            choices=('api', 'tarball'),
+            help='Fetch files through the API or from a tarball of the commit.'),
+        make_option('--cache', action='store_true', dest='cache', default=False,
+            help='Use a fresh response cache instead of none.'),
+        make_option('--record', action='store', dest='record', default=None,
+            help='Append the results as a line of JSON to this file.'),
+    )
+    help = ("Time a sync against a local fake GitHub serving synthetic repositories. "
+            "Creates and then deletes projects named benchmark-N.")
+
+    def measure(self, name, func):
+        """
+        Run ``func``, which returns the number of files or commits it
+        handled, and record its timing and the requests it made
+        """
+        self.hub.reset()
+        github_client.stats.reset()
+        start = time.time()
+        items = func()
+        seconds = time.time() - start
+        result = {
+            'name': name,
+            'seconds': seconds,
+            'calls': self.hub.calls,
+            'bytes': self.hub.bytes,
+            'items': items,
+            'calls_per_second': seconds and self.hub.calls / seconds or 0,
+            'items_per_second': seconds and items / seconds or 0,
+            'requests': dict(self.hub.requests),
+            'stats': github_client.stats.snapshot(reset=True),
+        }
+        logging.info("%s: %.2fs, %d calls" % (name, seconds, self.hub.calls))
+        self.results.append(result)
+        return result
+
+    def handle(self, *args, **options):
+        workers = max(options.get('workers') or 1, 1)
+        projects = max(options.get('projects') or 1, 1)
+
+        names = ['benchmark-%d' % i for i in range(projects + 1)]
+        if Project.objects.filter(github_repo__in=names).count() or \
+                Project.objects.filter(slug__in=names).count():
+            raise CommandError('Projects named benchmark-N exist already')
+
+        self.hub = FakeHub(latency=options.get('latency'))
+        repos = {}
+        for i, name in enumerate(names):
+            repos[name] = FakeRepo(options.get('files'), options.get('depth'),
+                                   options.get('commits'), options.get('file_size'),
+                                   options.get('changes'), seed=i, owner=GITHUB_LOGIN)
+            self.hub.add_repo(name, repos[name])
+        self.hub.start()
+
+        saved = (github_client.api_root, github_client.gist_root, github_client.archive_root,
+                 github_client.pool, github_client.limiter, github_client.cache,
+                 github_client.credentials)
+        cache_dir = None
+        rate = options.get('rate') or 1e9
+        github_client.api_root = self.hub.api_root
+        github_client.gist_root = self.hub.gist_root
+        github_client.archive_root = self.hub.archive_root
+        github_client.pool = ConnectionPool(workers * 2)
+        github_client.limiter = TokenBucket(rate, min(rate, 5))
+        github_client.cache = None
+        github_client.credentials = None
+        if options.get('tokens'):
+            github_client.credentials = CredentialPool([
+                Credential('benchmark%d' % i, 'token%d' % i, TokenBucket(rate, min(rate, 5)))
+                for i in range(options['tokens'])])
+        if options.get('cache'):
+            cache_dir = tempfile.mkdtemp()
+            github_client.cache = ResponseCache(cache_dir)
+
+        self.results = []
+        try:
+            self.run(names, repos, workers, options.get('mode'))
+        finally:
+            github_client.pool.clear()
+            (github_client.api_root, github_client.gist_root, github_client.archive_root,
+             github_client.pool, github_client.limiter, github_client.cache,
+             github_client.credentials) = saved
+            self.hub.stop()
+            if cache_dir:
+                shutil.rmtree(cache_dir, True)
+            self.cleanup(names, repos)
+
+        print "%-36s %8s %8s %10s %8s %10s" % ('benchmark', 'seconds', 'calls', 'calls/s',
+                                               'items', 'items/s')
+        for result in self.results:
+            print "%-36s %8.2f %8d %10.1f %8d %10.1f" % (result['name'], result['seconds'],
+                result['calls'], result['calls_per_second'], result['items'],
+                result['items_per_second'])
+
+        if options.get('record'):
+            record = {
+                'date': datetime.datetime.now().isoformat(),
+                'options': dict((key, options.get(key)) for key in ('files', 'depth',
+                    'commits', 'file_size', 'changes', 'projects', 'workers', 'latency',
+                    'rate', 'tokens', 'mode', 'cache')),
+                'results': self.results,
+            }
+            fh = open(options['record'], 'a')
+            try:
+                fh.write(simplejson.dumps(record) + '\n')
+            finally:
+                fh.close()
+
+    def run(self, names, repos, workers, mode):
+        project = Project.objects.create(title=names[0], github_repo=names[0],
+                                         description='Benchmark')
+
+        def files_stored():
+            return Blob.objects.filter(commit=project.latest_commit).count()
+
+        def first_sync():
+            project.fetch_github(mode=mode)
+            return files_stored()
+        self.measure('Project.fetch_github (first sync)', first_sync)
+
+        self.measure('Project.fetch_github (no changes)',
+                     lambda: len(project.fetch_github(mode=mode)))
+
+        repos[names[0]].commit()
+        commit = project.ingest_commits(
+            github_client.get_commits(GITHUB_LOGIN, project.github_repo)[:1])[0]
+        def incremental():
+            if mode == 'tarball':
+                commit.fetch_tarball()
+            else:
+                commit.fetch_blobs(workers=workers)
+            return Blob.objects.filter(commit=commit).count()
+        self.measure('Commit.%s (incremental)' % (mode == 'tarball' and 'fetch_tarball'
+                                                  or 'fetch_blobs'), incremental)
+
+        command = fetch_github.Command()
+        command.workers = workers
+        command.backfill = False
+        command.max_pages = None
+        command.mode = mode
+        synced = [Project.objects.create(title=name, github_repo=name, description='Benchmark')
+                  for name in names[1:]]
+        def sync():
+            command.sync(synced)
+            return Blob.objects.filter(commit__latest_for__in=synced).count()
+        self.measure('fetch_github command (%d projects)' % len(synced), sync)
+
+    def cleanup(self, names, repos):
+        """
+        Delete the benchmark projects and the content of their files
+        """
+        for project in Project.objects.filter(github_repo__in=names):
+            project.delete()
+        shas = set()
+        for repo in repos.values():
+            shas.update([blob['sha'] for blob in repo.blobs.values()])
+        for chunk in chunked(list(shas), 500):
+            contents = BlobContent.objects.filter(sha__in=chunk)
+            for content in contents.filter(storage=FileSystemStorage.name):
+                get_storage(content.storage).delete(content)
+            contents.delete()
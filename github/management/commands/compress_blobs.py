@@ -0,0 +1,43 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from optparse import make_option
+
+from github.models import BlobContent
+from github.storage import DatabaseStorage, GITHUB_BLOB_COMPRESSION
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int', dest='batch_size', default=500,
+            help='Number of rows converted per transaction.'),
+        make_option('--codec', action='store', dest='codec', default=GITHUB_BLOB_COMPRESSION,
+            help='Codec to compress with, default GITHUB_BLOB_COMPRESSION.'),
+    )
+    help = "Compress blob content stored uncompressed in the database."
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size')
+        storage = DatabaseStorage(codec=options.get('codec'))
+        
+        @transaction.commit_on_success
+        def convert(batch):
+            converted = 0
+            for content in batch:
+                storage.save(content, content.data)
+                if content.codec:
+                    content.save()
+                    converted += 1
+            return converted
+        
+        last_pk, total, converted = 0, 0, 0
+        qs = BlobContent.objects.filter(storage=DatabaseStorage.name, codec='').order_by('pk')
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            total += len(batch)
+            converted += convert(batch)
+            logging.info("%d rows checked, %d compressed" % (total, converted))
+        
+        print "%d of %d uncompressed rows compressed" % (converted, total)
@@ -1,9 +1,14 @@
 import logging
 import time
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
 
-from github.models import Project
+from github.libs.github import CallCounter
+from github.models import Project, SyncLease, SyncLeaseHeld, github_client
+from github.stats import publish
+from github.utils import configure_logging
 
 class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
@@ -11,13 +16,72 @@ class Command(BaseCommand):
             help='Fetch and process all repos.'),
         make_option('--verbose', action='store_true', dest='verbose', default=False,
             help='Verbose output.'),
+        make_option('--backfill', action='store_true', dest='backfill', default=False,
+            help='Walk the full commit history, resuming from the last checkpoint. '
+                 'Projects whose history is complete are skipped.'),
+        make_option('--max-pages', action='store', type='int', dest='max_pages', default=None,
+            help='Stop a backfill after this many pages of history.'),
+        make_option('--workers', action='store', type='int', dest='workers', default=1,
+            help='Number of projects to process at once.'),
+        make_option('--mode', action='store', dest='mode', default=None,
+            choices=('api', 'tarball'),
+            help='Fetch files through the API or from a tarball of the commit.'),
     )
     help = "Fetch and process GitHub projects, downloading commits and blobs for the latest commit."
     args = '[repo name]'
 
+    def log_progress(self, done, total):
+        if total is None:
+            logging.info("%d files stored" % done)
+        else:
+            logging.info("%d/%d files downloaded" % (done, total))
+
+    def log_page(self, page, new):
+        logging.info("page %d: %d new commits" % (page, new))
+
+    def process(self, project):
+        """
+        Sync a single project, returning (project, new commits, seconds, API
+        calls, error).  Runs in a worker thread, which gets its own database
+        connection and shares the client's rate limiter.  The project is
+        skipped if another worker holds its sync lease.
+        """
+        counter = CallCounter()
+        github_client.set_counter(counter)
+        start = time.time()
+        logging.info("Processing: %s..." % project.title)
+        commits_processed, error = [], None
+        try:
+            with SyncLease.objects.hold(project):
+                if self.backfill:
+                    commits_processed = project.backfill_github(self.max_pages,
+                                                                callback=self.log_page)
+                else:
+                    commits_processed = project.fetch_github(callback=self.log_progress,
+                                                             mode=self.mode)
+        except SyncLeaseHeld, e:
+            logging.info("Skipping %s: %s" % (project.title, e))
+            error = e
+        except Exception, e:
+            logging.exception("Error processing %s" % project.title)
+            github_client.stats.incr('sync.errors')
+            error = e
+        finally:
+            github_client.set_counter(None)
+            if self.workers > 1:
+                connection.close()
+        end = time.time()
+        logging.info("%s: %d new commits processed (took %fs)" % (
+            project.title, len(commits_processed), end - start))
+        return project, len(commits_processed), end - start, counter.calls, error
+
     def handle(self, repo_name='', *args, **options):
         fetch_all = options.get('fetch_all', False)
         verbose = options.get('verbose', False)
+        self.backfill = options.get('backfill', False)
+        self.max_pages = options.get('max_pages')
+        self.mode = options.get('mode')
+        self.workers = max(options.get('workers') or 1, 1)
         
         if not repo_name and not fetch_all:
             raise CommandError('Usage is fetch_github %s' % self.args)
@@ -25,30 +89,41 @@ class Command(BaseCommand):
             qs = Project.objects.filter(github_repo=repo_name.strip())
         else:
             qs = Project.objects.all()
+        if self.backfill:
+            qs = qs.filter(history_complete=False)
         
-        logging.basicConfig(
-            filename='github_log.log',
-            level=logging.DEBUG,
-            format='%(asctime)s %(levelname)-8s %(message)s',
-        )
+        configure_logging(verbose)
         
-        if verbose:
-            console = logging.StreamHandler()
-            console.setLevel(logging.INFO)
-            formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
-            console.setFormatter(formatter)
-            logging.getLogger('').addHandler(console)
-
-        logging.info('Download starting, fetching %d repos' % qs.count())
+        self.sync(list(qs))
+        publish(github_client.stats)
+    
+    def sync(self, projects):
+        """
+        Process ``projects``, on ``self.workers`` threads, and log a summary.
+        Returns the result of ``process`` for each project.
+        """
+        logging.info('Download starting, fetching %d repos with %d workers' % (
+            len(projects), self.workers))
         total_start = time.time()
         
-        for project in qs:
-            start = time.time()
-            logging.info("Processing: %s..." % project.title)
-            commits_processed = project.fetch_github()
-            end = time.time()
-            logging.info("%d new commits processed (took %fs)" % (len(commits_processed), end - start))
-            
+        if self.workers > 1:
+            pool = ThreadPool(self.workers)
+            try:
+                results = pool.map(self.process, projects)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(self.process, projects)
+        
         total_end = time.time()
-        logging.info("Finished processing %d repos" % qs.count())
+        logging.info("Finished processing %d repos" % len(projects))
         logging.info("Took %f seconds" % (total_end - total_start))
+        
+        logging.info("%-30s %8s %10s %8s" % ('project', 'commits', 'seconds', 'calls'))
+        for project, commits, seconds, calls, error in sorted(results, key=lambda r: -r[2]):
+            logging.info("%-30s %8d %10.2f %8d%s" % (project.title[:30], commits, seconds,
+                calls, error and ' (failed: %s)' % error or ''))
+        logging.info("%-30s %8d %10.2f %8d" % ('total', sum([r[1] for r in results]),
+            total_end - total_start, sum([r[3] for r in results])))
+        return results
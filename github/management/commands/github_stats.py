@@ -0,0 +1,29 @@
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+from github.libs.stats import format_snapshot
+from github.models import github_client
+from github.stats import clear, collect
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--json', action='store_true', dest='json', default=False,
+            help='Print the stats as JSON.'),
+        make_option('--clear', action='store_true', dest='clear', default=False,
+            help='Reset the stats after printing them.'),
+    )
+    help = "Show the API, throttle, cache and database stats recorded by syncs."
+
+    def handle(self, *args, **options):
+        snapshot = collect(github_client.stats)
+        if options.get('json'):
+            print simplejson.dumps(snapshot, indent=2, sort_keys=True)
+        else:
+            for line in format_snapshot(snapshot):
+                print line
+        if options.get('clear'):
+            clear(github_client.stats)
@@ -0,0 +1,49 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from optparse import make_option
+
+from github.models import BlobContent, Commit, Posting, SearchTerm
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', type='int', dest='batch_size', default=500,
+            help='Number of commits or files indexed per transaction.'),
+        make_option('--rebuild', action='store_true', dest='rebuild', default=False,
+            help='Drop the index and build it again from scratch.'),
+    )
+    help = ("Add commit messages and file contents stored before search was set up "
+            "to the search index.  Syncs keep the index up to date from then on.")
+
+    def index(self, qs, kind, index, batch_size):
+        last_pk, total, indexed = 0, 0, 0
+        qs = qs.order_by('pk')
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            total += len(batch)
+            done = set(Posting.objects.filter(kind=kind, document__in=[o.pk for o in batch]) \
+                .values_list('document', flat=True))
+            batch = [o for o in batch if o.pk not in done]
+            index(batch)
+            indexed += len(batch)
+            logging.info("%d rows checked, %d indexed" % (total, indexed))
+        return total, indexed
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size')
+        if options.get('rebuild'):
+            # straight DELETEs, as the ORM would load every row first
+            cursor = connection.cursor()
+            for model in (Posting, SearchTerm):
+                cursor.execute('DELETE FROM %s' % connection.ops.quote_name(model._meta.db_table))
+            transaction.commit_unless_managed()
+
+        total, indexed = self.index(Commit.objects.all(), Posting.COMMIT,
+                                    Posting.objects.index_commits, batch_size)
+        print "%d of %d commits indexed" % (indexed, total)
+        total, indexed = self.index(BlobContent.objects.all(), Posting.CONTENT,
+                                    Posting.objects.index_contents, batch_size)
+        print "%d of %d files indexed" % (indexed, total)
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from optparse import make_option
+
+from github.libs.github import CallCounter
+from github.models import Project, SyncLease, SyncLeaseHeld, github_client, \
+    GITHUB_POLL_BUDGET
+from github.stats import publish
+from github.utils import configure_logging
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--budget', action='store', type='int', dest='budget',
+            default=GITHUB_POLL_BUDGET,
+            help='Stop starting syncs once a tick has made this many API calls.'),
+        make_option('--workers', action='store', type='int', dest='workers', default=1,
+            help='Number of projects to sync at once.'),
+        make_option('--mode', action='store', dest='mode', default=None,
+            choices=('api', 'tarball'),
+            help='Fetch files through the API or from a tarball of the commit.'),
+        make_option('--loop', action='store_true', dest='loop', default=False,
+            help='Keep ticking instead of exiting after one tick.'),
+        make_option('--interval', action='store', type='float', dest='interval', default=60,
+            help='Seconds to wait between ticks.'),
+        make_option('--verbose', action='store_true', dest='verbose', default=False,
+            help='Verbose output.'),
+    )
+    help = ("Sync the projects whose next poll is due, within a budget of API calls. "
+            "Projects that commit often are polled often, dormant ones rarely.")
+
+    def poll(self, project, counter):
+        github_client.set_counter(counter)
+        start = time.time()
+        try:
+            with SyncLease.objects.hold(project):
+                commits = project.fetch_github(mode=self.mode)
+        except SyncLeaseHeld, e:
+            # the worker holding the lease reschedules the project
+            logging.info("Skipping %s: %s" % (project.title, e))
+        except Exception:
+            logging.exception("Error polling %s" % project.title)
+            github_client.stats.incr('sync.errors')
+            project.postpone_poll()
+        else:
+            logging.info("%s: %d new commits (took %fs), %.2f commits a day, next poll %s" % (
+                project.title, len(commits), time.time() - start, project.commit_rate,
+                project.next_poll))
+        finally:
+            github_client.set_counter(None)
+        github_client.stats.incr('poll.projects')
+
+    def tick(self):
+        """
+        Sync the projects that are due, most overdue first, until the tick
+        has made ``budget`` API calls.  A sync that has started is never cut
+        short, so the last ones can take a tick over its budget; projects
+        left over stay due and come first next tick.  Returns (projects
+        synced, API calls made, projects left due).
+        """
+        due = Project.objects.due()
+        counter = CallCounter()
+        lock = threading.Lock()
+        synced = []
+
+        def work():
+            try:
+                while True:
+                    lock.acquire()
+                    try:
+                        if not due or counter.calls >= self.budget:
+                            return
+                        project = due.pop(0)
+                        synced.append(project)
+                    finally:
+                        lock.release()
+                    self.poll(project, counter)
+            finally:
+                if self.workers > 1:
+                    connection.close()
+
+        if self.workers > 1:
+            threads = [threading.Thread(target=work) for i in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            work()
+
+        github_client.stats.incr('poll.deferred', len(due))
+        logging.info("Polled %d projects with %d API calls, %d still due" % (
+            len(synced), counter.calls, len(due)))
+        publish(github_client.stats)
+        return len(synced), counter.calls, len(due)
+
+    def handle(self, *args, **options):
+        self.budget = options.get('budget')
+        self.workers = max(options.get('workers') or 1, 1)
+        self.mode = options.get('mode')
+
+        configure_logging(options.get('verbose'))
+
+        while True:
+            self.tick()
+            if not options.get('loop'):
+                return
+            time.sleep(options.get('interval'))
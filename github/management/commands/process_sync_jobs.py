@@ -0,0 +1,59 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from optparse import make_option
+from threading import Thread
+
+from github.models import SyncJob, GITHUB_SYNC_MAX_RUNNING
+from github.utils import configure_logging
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', action='store', type='int', dest='workers', default=1,
+            help='Number of jobs this process runs at once.'),
+        make_option('--max-running', action='store', type='int', dest='max_running',
+            default=GITHUB_SYNC_MAX_RUNNING,
+            help='Do not start a job while this many are running, across all workers.'),
+        make_option('--loop', action='store_true', dest='loop', default=False,
+            help='Keep polling for new jobs instead of exiting once the queue is empty.'),
+        make_option('--interval', action='store', type='float', dest='interval', default=5,
+            help='Seconds to wait between polls.'),
+        make_option('--verbose', action='store_true', dest='verbose', default=False,
+            help='Verbose output.'),
+    )
+    help = "Run the project syncs queued by the GitHub hook."
+
+    def work(self):
+        try:
+            while True:
+                job = SyncJob.objects.claim(self.max_running)
+                if job is None:
+                    if not self.loop:
+                        return
+                    time.sleep(self.interval)
+                    continue
+                start = time.time()
+                logging.info("Syncing %s (%d requests)..." % (job.project.title, job.requests))
+                if job.run():
+                    logging.info("Synced %s (took %fs)" % (job.project.title, time.time() - start))
+                elif job.status == SyncJob.PENDING:
+                    logging.info("Requeued %s: %s" % (job.project.title, job.error))
+                else:
+                    logging.error("Sync of %s failed:\n%s" % (job.project.title, job.error))
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        self.max_running = options.get('max_running')
+        self.loop = options.get('loop', False)
+        self.interval = options.get('interval')
+        workers = max(options.get('workers') or 1, 1)
+        
+        configure_logging(options.get('verbose'))
+        
+        threads = [Thread(target=self.work) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -1,15 +1,139 @@
+import datetime
+import logging
+import math
+import mimetypes
 import os
+import socket
+import tarfile
+import tempfile
+import threading
 import time
+import traceback
+import uuid
+from contextlib import contextmanager
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.query import QuerySet
 from django.template.defaultfilters import slugify
+from github.libs.cache import ResponseCache
+from github.libs.credentials import CredentialPool
+from github.libs.fanout import ConcurrentGithubAPI
 from github.libs.github import GithubAPI
+from github.libs.gitobjects import blob_sha, tree_sha
+from github.libs.pool import ConnectionPool
+from github.libs.ratelimit import BACKENDS, TokenBucket
+from github.stats import publish
+from github.storage import DatabaseStorage, get_storage, GITHUB_BLOB_STORAGE
+from github.utils import bulk_insert, chunked, parent_path, tokenize, total_seconds
 
 GITHUB_LOGIN = getattr(settings, 'GITHUB_LOGIN', 'coleifer')
 GITHUB_TOKEN = getattr(settings, 'GITHUB_TOKEN', '')
-github_client = GithubAPI(GITHUB_LOGIN, GITHUB_TOKEN)
+GITHUB_CREDENTIALS = getattr(settings, 'GITHUB_CREDENTIALS', [])
+GITHUB_CREDENTIAL_COOLDOWN = getattr(settings, 'GITHUB_CREDENTIAL_COOLDOWN', 300)
+GITHUB_API_ROOT = getattr(settings, 'GITHUB_API_ROOT', 'http://github.com/api/v2/json')
+GITHUB_GIST_ROOT = getattr(settings, 'GITHUB_GIST_ROOT', 'http://gist.github.com')
+GITHUB_ARCHIVE_ROOT = getattr(settings, 'GITHUB_ARCHIVE_ROOT', 'http://github.com')
+GITHUB_POOL_SIZE = getattr(settings, 'GITHUB_POOL_SIZE', 4)
+GITHUB_POOL_IDLE_TIMEOUT = getattr(settings, 'GITHUB_POOL_IDLE_TIMEOUT', 60)
+GITHUB_RATE_LIMIT = getattr(settings, 'GITHUB_RATE_LIMIT', 1 / 1.15)
+GITHUB_RATE_BURST = getattr(settings, 'GITHUB_RATE_BURST', 5)
+GITHUB_RATE_BACKEND = getattr(settings, 'GITHUB_RATE_BACKEND', 'local')
+GITHUB_CACHE_DIR = getattr(settings, 'GITHUB_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'django-github-cache'))
+GITHUB_CACHE_ENTRIES = getattr(settings, 'GITHUB_CACHE_ENTRIES', 500)
+GITHUB_CACHE_MAX_FILES = getattr(settings, 'GITHUB_CACHE_MAX_FILES', 5000)
+GITHUB_CACHE_MAX_AGE = getattr(settings, 'GITHUB_CACHE_MAX_AGE', 60 * 60 * 24 * 7)
+GITHUB_FETCH_WORKERS = getattr(settings, 'GITHUB_FETCH_WORKERS', 4)
+GITHUB_BATCH_SIZE = getattr(settings, 'GITHUB_BATCH_SIZE', 100)
+GITHUB_FETCH_MODE = getattr(settings, 'GITHUB_FETCH_MODE', 'api')
+GITHUB_SYNC_MAX_RUNNING = getattr(settings, 'GITHUB_SYNC_MAX_RUNNING', 2)
+GITHUB_SYNC_LEASE = getattr(settings, 'GITHUB_SYNC_LEASE', 60 * 5)
+GITHUB_SEARCH_MAX_SIZE = getattr(settings, 'GITHUB_SEARCH_MAX_SIZE', 256 * 1024)
+GITHUB_POLL_MIN_INTERVAL = getattr(settings, 'GITHUB_POLL_MIN_INTERVAL', 60 * 10)
+GITHUB_POLL_MAX_INTERVAL = getattr(settings, 'GITHUB_POLL_MAX_INTERVAL', 60 * 60 * 24 * 7)
+GITHUB_POLL_TARGET = getattr(settings, 'GITHUB_POLL_TARGET', 0.5)
+GITHUB_POLL_RATE_WINDOW = getattr(settings, 'GITHUB_POLL_RATE_WINDOW', 60 * 60 * 24 * 7)
+GITHUB_POLL_BUDGET = getattr(settings, 'GITHUB_POLL_BUDGET', 100)
+github_client = GithubAPI(GITHUB_LOGIN, GITHUB_TOKEN,
+    pool=ConnectionPool(GITHUB_POOL_SIZE, GITHUB_POOL_IDLE_TIMEOUT),
+    limiter=TokenBucket(GITHUB_RATE_LIMIT, GITHUB_RATE_BURST,
+                        BACKENDS[GITHUB_RATE_BACKEND]()),
+    cache=ResponseCache(GITHUB_CACHE_DIR, GITHUB_CACHE_ENTRIES, GITHUB_CACHE_MAX_FILES,
+                        GITHUB_CACHE_MAX_AGE),
+    api_root=GITHUB_API_ROOT, gist_root=GITHUB_GIST_ROOT, archive_root=GITHUB_ARCHIVE_ROOT,
+    credentials=GITHUB_CREDENTIALS and CredentialPool.from_pairs(GITHUB_CREDENTIALS,
+        GITHUB_RATE_LIMIT, GITHUB_RATE_BURST, BACKENDS[GITHUB_RATE_BACKEND](),
+        GITHUB_CREDENTIAL_COOLDOWN) or None)
+
+@github_client.stats.timed('db.save_batch')
+@transaction.commit_on_success
+def save_batch(batch):
+    """
+    Save a batch of rows in one transaction
+    """
+    for obj in batch:
+        obj.save()
+    github_client.stats.incr('db.writes', len(batch))
+
+@github_client.stats.timed('db.save_contents')
+@transaction.commit_on_success
+def save_contents(batch):
+    """
+    Insert a batch of BlobContent rows in one transaction, skipping any sha
+    stored in the meantime by a sync of another project, and add the new
+    ones to the search index
+    """
+    saved = []
+    for content in batch:
+        sid = transaction.savepoint()
+        try:
+            content.save(force_insert=True)
+            transaction.savepoint_commit(sid)
+            saved.append(content)
+            github_client.stats.incr('db.writes')
+            github_client.stats.incr('db.contents')
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+    Posting.objects.index_contents(saved)
+
+def blob_bytes(blob):
+    """
+    The bytes of a file fetched through the API.  JSON only carries text,
+    so files not served as text come one character per byte.
+    """
+    data = blob.data or ''
+    if not isinstance(data, unicode):
+        return data
+    if not (blob.mime_type or '').startswith('text/'):
+        try:
+            return data.encode('latin-1')
+        except UnicodeEncodeError:
+            pass
+    return data.encode('utf-8')
+
+def poll_interval(commit_rate):
+    """
+    Seconds to wait before polling a project committing ``commit_rate``
+    times a day: long enough to expect GITHUB_POLL_TARGET new commits,
+    within GITHUB_POLL_MIN_INTERVAL and GITHUB_POLL_MAX_INTERVAL
+    """
+    if commit_rate <= 0:
+        return GITHUB_POLL_MAX_INTERVAL
+    interval = int(86400 * GITHUB_POLL_TARGET / commit_rate)
+    return max(GITHUB_POLL_MIN_INTERVAL, min(interval, GITHUB_POLL_MAX_INTERVAL))
+
+class ProjectManager(models.Manager):
+    def due(self, now=None):
+        """
+        Projects whose next poll is due, the ones never polled first and the
+        rest most overdue first
+        """
+        now = now or datetime.datetime.now()
+        projects = self.exclude(github_repo='')
+        return list(projects.filter(next_poll__isnull=True).order_by('created')) + \
+            list(projects.filter(next_poll__lte=now).order_by('next_poll'))
 
 class Project(models.Model):
     title = models.CharField(max_length=255)
@@ -17,6 +141,16 @@ class Project(models.Model):
     description = models.TextField()
     github_repo = models.CharField(max_length=255)
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+    history_page = models.IntegerField(default=1, editable=False)
+    history_complete = models.BooleanField(default=False, editable=False)
+    latest_commit = models.ForeignKey('Commit', blank=True, null=True, editable=False,
+                                      related_name='latest_for')
+    commit_rate = models.FloatField(default=0, editable=False)
+    last_polled = models.DateTimeField(blank=True, null=True, editable=False)
+    next_poll = models.DateTimeField(blank=True, null=True, editable=False, db_index=True)
+    
+    objects = ProjectManager()
     
     class Meta:
         ordering = ('title',)
@@ -33,6 +167,12 @@ class Project(models.Model):
         return reverse('project_detail', args=[self.slug])
     
     def get_latest_commit(self):
+        """
+        The newest commit whose tree has been stored, as recorded by the last
+        sync.  Falls back to a query for projects synced before it was kept.
+        """
+        if self.latest_commit_id:
+            return self.latest_commit
         try:
             return self.commits.all()[0]
         except IndexError:
@@ -50,37 +190,193 @@ class Project(models.Model):
             return ''
         return 'git clone git://github.com/%s/%s.git' % (GITHUB_LOGIN, self.github_repo)
     
-    def fetch_github(self):
+    @github_client.stats.timed('sync.fetch_github')
+    def fetch_github(self, callback=None, mode=None):
+        """
+        Store new commits and download the tree of the latest one.  History
+        is paged through until a commit that is already stored turns up; a
+        project with no commits yet only gets the first page, the rest is
+        left to ``backfill_github``.
+        
+        The tree is fetched file by file through the API, or from a single
+        tarball when ``mode`` (GITHUB_FETCH_MODE by default) is 'tarball',
+        falling back to the API if the tarball cannot be had.  It is fetched
+        whenever the newest commit's tree is not stored in full, so a fetch
+        that failed or left files out is retried by the next sync.  Until
+        then ``latest_commit`` stays on the newest commit stored in full.
+        """
         if not self.github_repo:
             raise AttributeError("No GitHub repo associated with project model")
         
-        commits_processed = []
-        
-        commit_list = github_client.get_commits(GITHUB_LOGIN, self.github_repo)
-        if not commit_list:
-            return commits_processed
+        known = set(self.commits.values_list('sha', flat=True))
+        first_sync = not known
         
         # store all the commits - an API call can be saved here, as all the
         # necessary commit data is returned by the get_commits() call.
-        for commit in commit_list:
-            instance, created = Commit.objects.get_or_create(project=self, sha=commit.id)
-            if created:
-                instance.created = commit.committed_date
-                instance.message = commit.message
-                instance.name = commit.committer.get('name', '')
-                instance.tree = commit.tree
-                instance.url = commit.url
-                instance.project = self
-                instance.save()
-                commits_processed.append(instance)
-        
-        # download the *latest* tree if new commits exist
-        if len(commits_processed):        
+        commits_processed = []
+        for page, commit_list in github_client.iter_commits(GITHUB_LOGIN, self.github_repo):
+            new_commits = self.ingest_commits(commit_list, known=known)
+            commits_processed.extend(new_commits)
+            if first_sync or len(new_commits) < len(commit_list):
+                break
+        
+        # download the *latest* tree unless it is already stored
+        if commits_processed:
             commit = commits_processed[0]
-            commit.fetch_blobs()
+        else:
+            # the newest stored commit, which is ahead of latest_commit if
+            # the last fetch failed
+            try:
+                commit = self.commits.all()[0]
+            except IndexError:
+                commit = None
+        if commit and not commit.is_synced():
+            fetched = False
+            if (mode or GITHUB_FETCH_MODE) == 'tarball':
+                try:
+                    commit.fetch_tarball(callback=callback)
+                    fetched = True
+                except ValueError, e:
+                    logging.warning("Tarball of %s unavailable, fetching files: %s" % (
+                        commit.sha, e))
+            if not fetched:
+                commit.fetch_blobs(callback=callback)
+            # a tree left incomplete is not served until a sync fills it in
+            if not commit.is_synced():
+                commit = commit.get_previous_synced()
+        if commit and commit.pk != self.latest_commit_id:
+            self.latest_commit = commit
+            Project.objects.filter(pk=self.pk).update(latest_commit=commit)
         
+        self.record_poll(len(commits_processed))
         return commits_processed
     
+    def record_poll(self, new_commits, now=None):
+        """
+        Fold the ``new_commits`` found by a sync into the project's commit
+        rate and schedule its next poll accordingly.
+        
+        The rate, in commits a day, is a count of commits decaying
+        exponentially over GITHUB_POLL_RATE_WINDOW, so a burst of activity
+        shortens the interval straight away and a quiet spell stretches it
+        out gradually.  The first sync has no previous poll to measure
+        from, so the rate starts from the stored commits dated within the
+        window.
+        """
+        now = now or datetime.datetime.now()
+        window = GITHUB_POLL_RATE_WINDOW / 86400.0
+        if self.last_polled:
+            elapsed = max(total_seconds(now - self.last_polled), 0)
+            decay = math.exp(-elapsed / GITHUB_POLL_RATE_WINDOW)
+            self.commit_rate = self.commit_rate * decay + new_commits / window
+        else:
+            since = now - datetime.timedelta(seconds=GITHUB_POLL_RATE_WINDOW)
+            self.commit_rate = self.commits.filter(created__gte=since).count() / window
+        self.last_polled = now
+        self.next_poll = now + datetime.timedelta(seconds=poll_interval(self.commit_rate))
+        Project.objects.filter(pk=self.pk).update(commit_rate=self.commit_rate,
+            last_polled=self.last_polled, next_poll=self.next_poll)
+    
+    def postpone_poll(self, now=None):
+        """
+        Put off the next poll by the current interval after a failed sync,
+        leaving the commit rate alone
+        """
+        now = now or datetime.datetime.now()
+        self.next_poll = now + datetime.timedelta(seconds=poll_interval(self.commit_rate))
+        Project.objects.filter(pk=self.pk).update(next_poll=self.next_poll)
+    
+    @github_client.stats.timed('sync.backfill_github')
+    def backfill_github(self, max_pages=None, callback=None):
+        """
+        Walk the project's full commit history, storing any commits that are
+        missing.  Progress is checkpointed after every page, so an
+        interrupted backfill resumes where it stopped.  Pages shift as new
+        commits are pushed, which only causes some overlap, never a gap.
+        ``callback(page, new)`` is called after each page.  The history is
+        marked complete once an empty page is reached; a page that cannot
+        be fetched raises ValueError and leaves the checkpoint before it.
+        """
+        if not self.github_repo:
+            raise AttributeError("No GitHub repo associated with project model")
+        
+        known = set(self.commits.values_list('sha', flat=True))
+        commits_processed = []
+        pages = 0
+        for page, commit_list in github_client.iter_commits(GITHUB_LOGIN,
+                self.github_repo, page=self.history_page):
+            new_commits = self.ingest_commits(commit_list, known=known)
+            commits_processed.extend(new_commits)
+            self.history_page = page + 1
+            updates = {'history_page': self.history_page}
+            if new_commits:
+                # older commits change the commit list pages
+                updates['updated'] = self.updated = datetime.datetime.now()
+            Project.objects.filter(pk=self.pk).update(**updates)
+            if callback:
+                callback(page, len(new_commits))
+            pages += 1
+            if max_pages and pages >= max_pages:
+                return commits_processed
+        
+        self.history_complete = True
+        Project.objects.filter(pk=self.pk).update(history_complete=True)
+        return commits_processed
+    
+    def ingest_commits(self, commit_list, batch_size=GITHUB_BATCH_SIZE, known=None):
+        """
+        Store the commits from ``commit_list`` that are not already known,
+        inserting them in batches inside one transaction, and index their
+        messages for search.  Returns the new rows in the order given.
+        ``known`` is the set of shas already stored; it is loaded when not
+        given and updated in place.
+        """
+        if known is None:
+            known = set(self.commits.values_list('sha', flat=True))
+        new_commits = []
+        for commit in commit_list:
+            if commit.id in known:
+                continue
+            known.add(commit.id)
+            new_commits.append(Commit(
+                project=self,
+                sha=commit.id,
+                created=commit.committed_date,
+                message=commit.message,
+                name=commit.committer.get('name', ''),
+                tree=commit.tree,
+                url=commit.url,
+            ))
+        
+        @github_client.stats.timed('db.ingest_commits')
+        @transaction.commit_on_success
+        def insert():
+            bulk_insert(new_commits, batch_size)
+        insert()
+        github_client.stats.incr('db.writes', len(new_commits))
+        github_client.stats.incr('db.commits', len(new_commits))
+        
+        rows = {}
+        for chunk in chunked([c.sha for c in new_commits], batch_size):
+            for commit in self.commits.filter(sha__in=chunk):
+                rows[commit.sha] = commit
+        new_commits = [rows[c.sha] for c in new_commits]
+        Posting.objects.index_commits(new_commits)
+        return new_commits
+    
+class CommitQuerySet(QuerySet):
+    def delete(self):
+        for chunk in chunked(self.values_list('pk', flat=True), 500):
+            Posting.objects.unindex(Posting.COMMIT, chunk)
+            # foreign keys cascade even when nullable, so the projects whose
+            # latest commit this is would be deleted along with it
+            Project.objects.filter(latest_commit__in=chunk).update(latest_commit=None)
+        super(CommitQuerySet, self).delete()
+
+class CommitManager(models.Manager):
+    def get_query_set(self):
+        return CommitQuerySet(self.model)
+
 class Commit(models.Model):
     project = models.ForeignKey(Project, related_name='commits')
     sha = models.CharField(max_length=255)
@@ -90,6 +386,8 @@ class Commit(models.Model):
     message = models.TextField(blank=True)
     url = models.URLField()
     
+    objects = CommitManager()
+    
     class Meta:
         ordering = ['-created']
     
@@ -99,6 +397,11 @@ class Commit(models.Model):
     def get_absolute_url(self):
         return self.url
     
+    def delete(self):
+        Posting.objects.unindex(Posting.COMMIT, [self.pk])
+        Project.objects.filter(latest_commit=self).update(latest_commit=None)
+        super(Commit, self).delete()
+    
     def fetch_github(self):
         if not self.project or not self.project.github_repo:
             raise AttributeError('Required attribute missing: "github_repo" on %s' % self.project)
@@ -112,17 +415,368 @@ class Commit(models.Model):
             self.save()
         return commit
     
-    def fetch_blobs(self):
-        def process_tree(tree, path=''):
-            objs = github_client.get_tree(GITHUB_LOGIN, self.project.github_repo, tree)
-            for obj in objs:
-                if obj.type == 'tree':
-                    process_tree(obj.sha, path + obj.name + '/')
-                blob, created = Blob.objects.get_or_create(commit=self, name=obj.name, path='%s%s' % (path, obj.name))
-                if created:
-                    fetched = blob.fetch_github(tree, path)
-            return
-        process_tree(self.tree)
+    def is_synced(self):
+        """
+        Whether this commit's whole tree is stored
+        """
+        return self.directories.filter(path='', complete=True).count() > 0
+    
+    def get_previous_synced(self):
+        """
+        The most recent other commit of this project whose tree is stored
+        """
+        try:
+            return Directory.objects.filter(commit__project=self.project, path='',
+                                            complete=True) \
+                .exclude(commit=self).order_by('-commit__created')[0].commit
+        except IndexError:
+            return None
+    
+    @github_client.stats.timed('sync.fetch_blobs')
+    def fetch_blobs(self, workers=GITHUB_FETCH_WORKERS, batch_size=GITHUB_BATCH_SIZE,
+                    callback=None):
+        """
+        Download every file in this commit's tree.  Directories are expanded
+        a level at a time and files fetched ``workers`` at once through a
+        ConcurrentGithubAPI, all sharing the client's rate limiter.
+        
+        Tree shas are content hashes, so any directory whose sha was already
+        stored for the previous synced commit is copied from it rather than
+        walked.  Content is stored once per git sha, so only shas not already
+        in the database are downloaded.  Rows are saved in batches of
+        ``batch_size`` and ``callback(done, total)`` is called after each
+        batch of downloads.
+        """
+        repo = self.project.github_repo
+        existing = set(self.blobs.values_list('path', flat=True))
+        existing_dirs = dict(self.directories.values_list('path', 'complete'))
+        
+        previous = self.get_previous_synced()
+        previous_dirs = {}
+        if previous:
+            previous_dirs = dict(previous.directories.values_list('sha', 'path'))
+        
+        stats = github_client.stats
+        
+        def carry_forward(old_path, path):
+            for model, rows in ((Directory, previous.directories),
+                                (Blob, previous.blobs)):
+                batch = []
+                for row in rows.filter(path__startswith=old_path):
+                    new_path = path + row.path[len(old_path):]
+                    if new_path in existing or new_path in existing_dirs:
+                        continue
+                    row.pk = None
+                    row.commit = self
+                    row.path = new_path
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        save_batch(batch)
+                        batch = []
+                save_batch(batch)
+        
+        api = ConcurrentGithubAPI(github_client, workers)
+        try:
+            files = []
+            directories = []
+            failed = []
+            level = [(self.tree, '')]
+            while level:
+                to_walk = []
+                for tree, path in level:
+                    if tree in previous_dirs:
+                        stats.incr('sync.trees_carried_forward')
+                        carry_forward(previous_dirs[tree], path)
+                    else:
+                        to_walk.append((tree, path))
+                
+                level = []
+                trees = api.map('get_tree', [(GITHUB_LOGIN, repo, tree)
+                                             for tree, path in to_walk])
+                for (tree, path), objs in zip(to_walk, trees):
+                    if objs is False:
+                        failed.append(path)
+                        continue
+                    if path not in existing_dirs:
+                        directories.append(Directory(commit=self, path=path, sha=tree))
+                    for obj in objs:
+                        if obj.type == 'tree':
+                            level.append((obj.sha, path + obj.name + '/'))
+                        elif path + obj.name not in existing:
+                            files.append((tree, path, obj))
+            
+            # metadata for every sha already stored, then one download per
+            # sha that is not
+            stored = {}
+            shas = list(set(obj.sha for tree, path, obj in files))
+            for chunk in chunked(shas, batch_size):
+                for sha, size, mime_type in BlobContent.objects.filter(sha__in=chunk) \
+                        .values_list('sha', 'size', 'mime_type'):
+                    stored[sha] = (size, mime_type)
+            
+            missing = {}
+            for tree, path, obj in files:
+                if obj.sha not in stored:
+                    missing.setdefault(obj.sha, (tree, path, obj))
+            stats.incr('sync.contents_reused', len(files) - len(missing))
+            
+            batch = []
+            done = 0
+            to_fetch = missing.values()
+            for index, data in api.imap_unordered('get_blob', [(GITHUB_LOGIN, repo, tree, obj.name)
+                                                               for tree, path, obj in to_fetch]):
+                tree, path, obj = to_fetch[index]
+                done += 1
+                if data:
+                    raw = blob_bytes(data)
+                    if blob_sha(raw) != obj.sha:
+                        # left out, so the path counts as failed below
+                        stats.incr('sync.corrupt_blobs')
+                        logging.warning("Content of %s%s does not match its sha %s" % (
+                            path, obj.name, obj.sha))
+                    else:
+                        content = BlobContent(sha=obj.sha, size=len(raw),
+                                              mime_type=data.mime_type)
+                        content.store_bytes(raw)
+                        batch.append(content)
+                        stored[obj.sha] = (len(raw), data.mime_type)
+                if len(batch) >= batch_size or done == len(missing):
+                    save_contents(batch)
+                    batch = []
+                    if callback:
+                        callback(done, len(missing))
+        finally:
+            api.close()
+        
+        fetched = []
+        for chunk in chunked(files, batch_size):
+            batch = []
+            for tree, path, obj in chunk:
+                if obj.sha in stored:
+                    size, mime_type = stored[obj.sha]
+                    batch.append(Blob(commit=self, name=obj.name, path=path + obj.name,
+                                      size=size, mime_type=mime_type, sha=obj.sha))
+                else:
+                    failed.append(path)
+            save_batch(batch)
+            fetched.extend(batch)
+        
+        stats.incr('sync.failed_paths', len(failed))
+        
+        # a directory with anything beneath it missing is listed but marked
+        # incomplete, so that later syncs do not carry the gaps forward
+        for chunk in chunked(directories, batch_size):
+            for directory in chunk:
+                directory.complete = not any(p.startswith(directory.path) for p in failed)
+            save_batch(chunk)
+        filled = [path for path, complete in existing_dirs.items()
+                  if not complete and not any(p.startswith(path) for p in failed)]
+        for chunk in chunked(filled, batch_size):
+            self.directories.filter(path__in=chunk).update(complete=True)
+        
+        return fetched
+    
+    @github_client.stats.timed('sync.fetch_tarball')
+    def fetch_tarball(self, batch_size=GITHUB_BATCH_SIZE, callback=None):
+        """
+        Store every file in this commit's tree from one tarball of the
+        commit, instead of an API call per directory and per file.  The
+        archive is decompressed as it streams in, so only a batch of files
+        is held in memory at a time; each batch of ``batch_size`` is saved
+        at once and followed by ``callback(done, None)``, the total not
+        being known until the archive ends.
+        
+        Blob and tree shas are computed the way git computes them, so rows
+        match those stored by ``fetch_blobs`` and content is still stored
+        once per sha.
+        """
+        existing = set(self.blobs.values_list('path', flat=True))
+        existing_dirs = set(self.directories.values_list('path', flat=True))
+        stats = github_client.stats
+        
+        # (mode, name, sha) of the entries of each directory, by path
+        entries = {'': []}
+        fetched = []
+        pending = []
+        
+        def store(pending):
+            stored = dict(BlobContent.objects.filter(sha__in=set(p[2] for p in pending)) \
+                .values_list('sha', 'mime_type'))
+            contents = []
+            for path, name, sha, data in pending:
+                if sha not in stored:
+                    mime_type = mimetypes.guess_type(name)[0] or \
+                        ('\0' in data and 'application/octet-stream' or 'text/plain')
+                    content = BlobContent(sha=sha, size=len(data), mime_type=mime_type)
+                    content.store_bytes(data)
+                    contents.append(content)
+                    stored[sha] = mime_type
+            save_contents(contents)
+            batch = [Blob(commit=self, name=name, path=path, size=len(data),
+                          mime_type=stored[sha], sha=sha)
+                     for path, name, sha, data in pending]
+            save_batch(batch)
+            fetched.extend(batch)
+            if callback:
+                callback(len(fetched), None)
+        
+        response = github_client.open_tarball(GITHUB_LOGIN, self.project.github_repo, self.sha)
+        try:
+            archive = tarfile.open(fileobj=response, mode='r|gz')
+            for member in archive:
+                # everything sits under a directory named after the commit
+                path = member.name.partition('/')[2]
+                if not path or member.isdir():
+                    continue
+                if member.issym():
+                    mode, data = '120000', member.linkname
+                elif member.isfile():
+                    mode = member.mode & 0111 and '100755' or '100644'
+                    data = archive.extractfile(member).read()
+                else:
+                    continue
+                directory = parent_path(path)
+                name = path[len(directory):]
+                sha = blob_sha(data)
+                entries.setdefault(directory, []).append((mode, name, sha))
+                path = path.decode('utf-8', 'replace')
+                if path not in existing:
+                    pending.append((path, name.decode('utf-8', 'replace'), sha, data))
+                if len(pending) >= batch_size:
+                    store(pending)
+                    pending = []
+            archive.close()
+        finally:
+            response.close()
+        if pending:
+            store(pending)
+        stats.incr('sync.tarball_files', sum([len(e) for e in entries.values()]))
+        
+        # directories holding only subdirectories have no files of their own
+        for path in entries.keys():
+            while path:
+                path = parent_path(path)
+                entries.setdefault(path, [])
+        
+        # hash the trees bottom up, each adding itself to its parent
+        directories = []
+        for path in sorted(entries, key=lambda p: -p.count('/')):
+            sha = path and tree_sha(entries[path]) or self.tree
+            if path:
+                entries[parent_path(path)].append(('040000', path.rstrip('/').split('/')[-1], sha))
+            path = path.decode('utf-8', 'replace')
+            if path not in existing_dirs:
+                directories.append(Directory(commit=self, path=path, sha=sha))
+        for chunk in chunked(directories, batch_size):
+            save_batch(chunk)
+        # left incomplete by an earlier fetch through the API
+        self.directories.filter(complete=False).update(complete=True)
+        
+        return fetched
+
+class Directory(models.Model):
+    """
+    A tree stored for a commit, identified by its git tree sha.  The root
+    tree has an empty path, every other path ends with a slash.  A
+    directory is ``complete`` once every file beneath it is stored; only
+    complete ones are carried forward to later commits.
+    """
+    commit = models.ForeignKey(Commit, related_name='directories')
+    path = models.CharField(max_length=255)
+    sha = models.CharField(max_length=40, db_index=True)
+    name = models.CharField(max_length=255, blank=True)
+    parent = models.CharField(max_length=255, blank=True, db_index=True)
+    complete = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['path']
+    
+    def __unicode__(self):
+        return '%s/%s' % (self.commit.sha[:8], self.path)
+    
+    def save(self, *args, **kwargs):
+        self.name = self.path.rstrip('/').split('/')[-1]
+        self.parent = parent_path(self.path)
+        super(Directory, self).save(*args, **kwargs)
+
+class BlobContentQuerySet(QuerySet):
+    def delete(self):
+        for chunk in chunked(self.values_list('pk', flat=True), 500):
+            Posting.objects.unindex(Posting.CONTENT, chunk)
+        super(BlobContentQuerySet, self).delete()
+
+class BlobContentManager(models.Manager):
+    def get_query_set(self):
+        return BlobContentQuerySet(self.model)
+
+class BlobContent(models.Model):
+    """
+    The contents of a file, stored once per git blob sha and shared by every
+    commit that contains it.  Deleting it takes it out of the search index.
+    """
+    sha = models.CharField(max_length=40, unique=True)
+    size = models.IntegerField(default=0)
+    mime_type = models.CharField(max_length=255)
+    data = models.TextField(blank=True)
+    storage = models.CharField(max_length=10, default='db', editable=False)
+    codec = models.CharField(max_length=10, blank=True, editable=False)
+    
+    objects = BlobContentManager()
+    
+    def __unicode__(self):
+        return '%s (%s)' % (self.sha, self.size)
+    
+    def delete(self):
+        Posting.objects.unindex(Posting.CONTENT, [self.pk])
+        super(BlobContent, self).delete()
+    
+    def store(self, data, storage=None):
+        """
+        Write ``data`` to the configured storage (GITHUB_BLOB_STORAGE) and
+        record which one holds it; the row still has to be saved
+        """
+        backend = get_storage(storage or GITHUB_BLOB_STORAGE)
+        backend.save(self, data)
+        self.storage = backend.name
+        if isinstance(data, unicode):
+            # kept for indexing, which would otherwise read it back
+            self._text = data
+    
+    def store_bytes(self, data):
+        """
+        Store a file's raw bytes, as text when they are UTF-8
+        """
+        try:
+            self.store(data.decode('utf-8'))
+        except UnicodeDecodeError:
+            self.store(data)
+    
+    def open(self):
+        """
+        A file-like object over the content, as bytes
+        """
+        return get_storage(self.storage).open(self)
+    
+    def read(self):
+        fh = self.open()
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+    
+    @property
+    def text(self):
+        """
+        The content as unicode, decompressed on first access
+        """
+        if not hasattr(self, '_text'):
+            if self.storage == DatabaseStorage.name and not self.codec:
+                self._text = self.data
+                if isinstance(self._text, str):
+                    self._text = self._text.decode('utf-8', 'replace')
+            else:
+                self._text = self.read().decode('utf-8', 'replace')
+        return self._text
 
 class Blob(models.Model):
     commit = models.ForeignKey(Commit, related_name='blobs')
@@ -130,15 +784,19 @@ class Blob(models.Model):
     path = models.CharField(max_length=255, editable=False)
     size = models.IntegerField(default=0)
     mime_type = models.CharField(max_length=255)
-    data = models.TextField()
-    sha = models.CharField(max_length=255)
+    sha = models.CharField(max_length=255, db_index=True)
+    directory = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
     
     class Meta:
-        ordering = ['-commit__created', 'commit__project__title', 'path']
+        ordering = ['path']
     
     def __unicode__(self):
         return '%s (%s)' % (self.path, self.size)
     
+    def save(self, *args, **kwargs):
+        self.directory = parent_path(self.path)
+        super(Blob, self).save(*args, **kwargs)
+    
     def get_absolute_url(self):
         return reverse('blob_detail', args=[self.commit.project.slug, self.path])
     
@@ -146,15 +804,450 @@ class Blob(models.Model):
     def download_url(self):
         return reverse('blob_download', args=[self.commit.project.slug, self.path])
     
+    @property
+    def content(self):
+        if not hasattr(self, '_content'):
+            try:
+                self._content = BlobContent.objects.get(sha=self.sha)
+            except BlobContent.DoesNotExist:
+                self._content = None
+        return self._content
+    
+    @property
+    def data(self):
+        if self.content is None:
+            return ''
+        return self.content.text
+    
     def fetch_github(self, tree, path=''):
         if not self.commit or not self.name:
             raise AttributeError('Required attribute missing on Blob object')
         blob = github_client.get_blob(GITHUB_LOGIN, self.commit.project.github_repo, tree, self.name)
         if blob:
+            try:
+                self._content = BlobContent.objects.get(sha=blob.sha)
+            except BlobContent.DoesNotExist:
+                self._content = BlobContent(sha=blob.sha, size=blob.size,
+                                            mime_type=blob.mime_type)
+                self._content.store_bytes(blob_bytes(blob))
+                self._content.save()
+                Posting.objects.index_contents([self._content])
             self.path = path + blob.name
             self.size = blob.size
             self.mime_type = blob.mime_type
-            self.data = blob.data
             self.sha = blob.sha
             self.save()
         return blob
+
+class SyncJobManager(models.Manager):
+    def enqueue(self, project):
+        """
+        Queue a sync of ``project``, folding the request into a job that is
+        already pending for it
+        """
+        pending = self.filter(project=project, status=SyncJob.PENDING)
+        if pending.update(requests=models.F('requests') + 1):
+            return pending[0]
+        return self.create(project=project)
+    
+    def requeue_stale(self, now=None):
+        """
+        Put back to pending the jobs left running by a worker that died: a
+        running job holds its project's sync lease, so one that has had
+        none for GITHUB_SYNC_LEASE seconds is no longer being run.  Returns
+        the number requeued.
+        """
+        now = now or datetime.datetime.now()
+        leased = list(SyncLease.objects.filter(expires__gt=now).values_list('project', flat=True))
+        stale = self.filter(status=SyncJob.RUNNING,
+            started__lte=now - datetime.timedelta(seconds=GITHUB_SYNC_LEASE))
+        requeued = stale.exclude(project__in=leased).update(status=SyncJob.PENDING,
+                                                            started=None, slot=None)
+        if requeued:
+            github_client.stats.incr('sync.jobs_requeued', requeued)
+        return requeued
+    
+    def claim(self, max_running=GITHUB_SYNC_MAX_RUNNING):
+        """
+        Mark the oldest pending job as running and return it, or None if
+        nothing is pending or ``max_running`` jobs are already running.
+        Other jobs pending for the same project are merged into it.  Jobs
+        for a project another worker holds the sync lease on are left
+        pending.
+        
+        A running job takes one of ``max_running`` slots, unique across
+        running jobs, in the same UPDATE that marks it running, so racing
+        workers cannot start more jobs than there are slots.
+        """
+        self.requeue_stale()
+        running = self.filter(status=SyncJob.RUNNING)
+        taken = set(running.values_list('slot', flat=True))
+        free = [slot for slot in range(max_running) if slot not in taken]
+        if not free:
+            return None
+        busy = list(running.values_list('project', flat=True))
+        busy.extend(SyncLease.objects.filter(expires__gt=datetime.datetime.now()) \
+            .values_list('project', flat=True))
+        
+        @transaction.commit_on_success
+        def start(job, slot):
+            return self.filter(pk=job.pk, status=SyncJob.PENDING).update(
+                status=SyncJob.RUNNING, started=datetime.datetime.now(), slot=slot)
+        
+        for job in self.filter(status=SyncJob.PENDING).exclude(project__in=busy) \
+                .order_by('created'):
+            started = None
+            while free and started is None:
+                try:
+                    started = start(job, free[0])
+                except IntegrityError:
+                    # another worker took the slot
+                    free.pop(0)
+            if not free:
+                return None
+            if started:
+                duplicates = self.filter(project=job.project_id, status=SyncJob.PENDING)
+                merged = sum(duplicates.values_list('requests', flat=True))
+                if merged:
+                    duplicates.delete()
+                    self.filter(pk=job.pk).update(requests=job.requests + merged)
+                return self.get(pk=job.pk)
+        return None
+
+class SyncJob(models.Model):
+    """
+    A queued sync of a project, created by the GitHub hook and run by the
+    ``process_sync_jobs`` command.  A running job holds one of the
+    GITHUB_SYNC_MAX_RUNNING ``slot`` numbers.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    
+    project = models.ForeignKey(Project, related_name='sync_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING,
+                              db_index=True)
+    requests = models.IntegerField(default=1)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    slot = models.IntegerField(blank=True, null=True, unique=True, editable=False)
+    
+    objects = SyncJobManager()
+    
+    class Meta:
+        ordering = ['-created']
+    
+    def __unicode__(self):
+        return '%s (%s)' % (self.project.title, self.status)
+    
+    def run(self):
+        """
+        Sync the project, holding its lease.  If another worker is syncing
+        it, the job goes back to pending, to be claimed once the lease is
+        released, so the push is not missed.
+        """
+        try:
+            with SyncLease.objects.hold(self.project):
+                self.project.fetch_github()
+        except SyncLeaseHeld, e:
+            SyncJob.objects.filter(pk=self.pk).update(status=SyncJob.PENDING, started=None,
+                                                      slot=None)
+            self.status, self.started, self.slot, self.error = SyncJob.PENDING, None, None, str(e)
+            return False
+        except Exception:
+            self.status = SyncJob.FAILED
+            self.error = traceback.format_exc()
+            github_client.stats.incr('sync.errors')
+        else:
+            self.status = SyncJob.DONE
+        self.finished = datetime.datetime.now()
+        self.slot = None
+        self.save()
+        publish(github_client.stats)
+        return self.status == SyncJob.DONE
+
+class SyncLeaseHeld(Exception):
+    pass
+
+def lease_owner():
+    """
+    A name for a worker taking a lease, unique to the host, process and
+    the taking
+    """
+    return '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+class LeaseHeartbeat(threading.Thread):
+    """
+    Renews a lease every third of its duration until stopped
+    """
+    def __init__(self, lease, duration):
+        super(LeaseHeartbeat, self).__init__()
+        self.setDaemon(True)
+        self.lease = lease
+        self.duration = duration
+        self.stopped = threading.Event()
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+    
+    def run(self):
+        try:
+            while True:
+                self.stopped.wait(self.duration / 3.0)
+                if self.stopped.isSet():
+                    return
+                try:
+                    renewed = self.lease.renew(self.duration)
+                except Exception:
+                    logging.exception('Could not renew the sync lease on %s' %
+                                      self.lease.project_id)
+                    continue
+                if not renewed:
+                    github_client.stats.incr('lease.lost')
+                    logging.warning('Lost the sync lease on %s' % self.lease.project_id)
+                    return
+        finally:
+            connection.close()
+
+class SyncLeaseManager(models.Manager):
+    def acquire(self, project, owner=None, duration=GITHUB_SYNC_LEASE):
+        """
+        Take the lease on syncing ``project`` for ``duration`` seconds and
+        return it, or None if another worker holds it.  A lease past its
+        expiry, left by a worker that crashed, is taken over.  Taking it is
+        a single conditional UPDATE, or an INSERT of the project's row the
+        first time, so only one of several racing workers succeeds.
+        """
+        owner = owner or lease_owner()
+        now = datetime.datetime.now()
+        expires = now + datetime.timedelta(seconds=duration)
+        free = self.filter(project=project).filter(models.Q(expires__isnull=True) |
+                                                   models.Q(expires__lte=now))
+        if free.update(owner=owner, acquired=now, expires=expires):
+            return self.get(project=project)
+        
+        @transaction.commit_on_success
+        def insert():
+            return self.create(project=project, owner=owner, acquired=now, expires=expires)
+        try:
+            return insert()
+        except IntegrityError:
+            # the row exists, held by another worker
+            return None
+    
+    @contextmanager
+    def hold(self, project, owner=None, duration=GITHUB_SYNC_LEASE):
+        """
+        Hold the lease on ``project`` for the length of a ``with`` block,
+        renewing it in the background and releasing it at the end.  Raises
+        SyncLeaseHeld if another worker holds it.
+        """
+        lease = self.acquire(project, owner, duration)
+        if lease is None:
+            github_client.stats.incr('lease.busy')
+            raise SyncLeaseHeld('%s is being synced by another worker' % project)
+        heartbeat = LeaseHeartbeat(lease, duration)
+        heartbeat.start()
+        try:
+            yield lease
+        finally:
+            heartbeat.stop()
+            lease.release()
+
+class SyncLease(models.Model):
+    """
+    The right to sync a project, held by one worker at a time.  Workers on
+    several machines share the projects by taking the lease before a sync;
+    it expires unless renewed, so a crashed worker's projects are picked up
+    again.  Expiry is compared against each machine's clock, which should
+    be kept in step.
+    """
+    project = models.OneToOneField(Project, related_name='sync_lease')
+    owner = models.CharField(max_length=255, blank=True)
+    acquired = models.DateTimeField(blank=True, null=True)
+    expires = models.DateTimeField(blank=True, null=True, db_index=True)
+    
+    objects = SyncLeaseManager()
+    
+    def __unicode__(self):
+        return '%s (%s)' % (self.project.title, self.owner or 'free')
+    
+    def renew(self, duration=GITHUB_SYNC_LEASE):
+        """
+        Push the expiry ``duration`` seconds out, returning False if the
+        lease has been taken over in the meantime
+        """
+        self.expires = datetime.datetime.now() + datetime.timedelta(seconds=duration)
+        return bool(SyncLease.objects.filter(pk=self.pk, owner=self.owner) \
+            .update(expires=self.expires))
+    
+    def release(self):
+        SyncLease.objects.filter(pk=self.pk, owner=self.owner).update(owner='', expires=None)
+
+class SearchTermManager(models.Manager):
+    def ids(self, terms, create=False):
+        """
+        A dict of the ids of ``terms``, adding those not yet known when
+        ``create`` is set.  Call it inside a transaction.
+        """
+        terms = list(terms)
+        found = {}
+        for chunk in chunked(terms, 500):
+            found.update(self.filter(term__in=chunk).values_list('term', 'pk'))
+        missing = [term for term in terms if term not in found]
+        if not create or not missing:
+            return found
+        sid = transaction.savepoint()
+        try:
+            bulk_insert([SearchTerm(term=term) for term in missing])
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            # some were added in the meantime by another worker
+            transaction.savepoint_rollback(sid)
+            for term in missing:
+                sid = transaction.savepoint()
+                try:
+                    SearchTerm(term=term).save(force_insert=True)
+                    transaction.savepoint_commit(sid)
+                except IntegrityError:
+                    transaction.savepoint_rollback(sid)
+        for chunk in chunked(missing, 500):
+            found.update(self.filter(term__in=chunk).values_list('term', 'pk'))
+        return found
+
+class SearchTerm(models.Model):
+    """
+    A word of the search index, with the number of commit messages and of
+    file contents it occurs in
+    """
+    term = models.CharField(max_length=64, unique=True)
+    commits = models.IntegerField(default=0)
+    contents = models.IntegerField(default=0)
+    
+    objects = SearchTermManager()
+    
+    def __unicode__(self):
+        return self.term
+
+class PostingManager(models.Manager):
+    def index_commits(self, commits):
+        self.index(Posting.COMMIT, [(c.pk, c.project_id, c.message) for c in commits])
+    
+    def index_contents(self, contents):
+        """
+        Index the text of BlobContent rows, leaving out binary files and
+        files over GITHUB_SEARCH_MAX_SIZE
+        """
+        documents = []
+        for content in contents:
+            if content.size > GITHUB_SEARCH_MAX_SIZE:
+                continue
+            text = content.text
+            # NULs, or bytes that were not UTF-8, mark a binary file
+            if u'\0' not in text and u'\ufffd' not in text:
+                documents.append((content.pk, None, text))
+        self.index(Posting.CONTENT, documents)
+    
+    @github_client.stats.timed('db.index')
+    @transaction.commit_on_success
+    def index(self, kind, documents, batch_size=GITHUB_BATCH_SIZE):
+        """
+        Add ``documents``, a list of ``(id, project id, text)``, to the
+        index: one posting per distinct term of each, inserted in batches,
+        and one UPDATE per distinct increment of the terms' document counts
+        """
+        found = []
+        for document, project, text in documents:
+            counts = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            if counts:
+                found.append((document, project, counts))
+        if not found:
+            return
+        
+        ids = SearchTerm.objects.ids(set().union(*[counts for d, p, counts in found]),
+                                     create=True)
+        postings = []
+        increments = {}
+        for document, project, counts in found:
+            # longer documents match more terms, so each weighs less
+            norm = math.sqrt(len(counts))
+            for term, frequency in counts.items():
+                term_id = ids[term]
+                postings.append(Posting(term_id=term_id, kind=kind, document=document,
+                                        project_id=project, frequency=frequency,
+                                        weight=(1 + math.log(frequency)) / norm))
+                increments[term_id] = increments.get(term_id, 0) + 1
+        bulk_insert(postings, batch_size)
+        
+        field = kind == Posting.COMMIT and 'commits' or 'contents'
+        by_increment = {}
+        for term_id, increment in increments.items():
+            by_increment.setdefault(increment, []).append(term_id)
+        for increment, term_ids in by_increment.items():
+            for chunk in chunked(term_ids, 500):
+                SearchTerm.objects.filter(pk__in=chunk).update(
+                    **{field: models.F(field) + increment})
+        github_client.stats.incr('db.writes', len(postings))
+        github_client.stats.incr('db.postings', len(postings))
+    
+    @transaction.commit_on_success
+    def unindex(self, kind, documents):
+        """
+        Take the documents with ids ``documents`` out of the index, before
+        deleting them: ids may be reused by the database.  Deleting commits
+        or BlobContent rows through the ORM calls this.
+        """
+        postings = self.filter(kind=kind, document__in=list(documents))
+        decrements = {}
+        for term_id in postings.values_list('term', flat=True):
+            decrements[term_id] = decrements.get(term_id, 0) + 1
+        field = kind == Posting.COMMIT and 'commits' or 'contents'
+        by_decrement = {}
+        for term_id, decrement in decrements.items():
+            by_decrement.setdefault(decrement, []).append(term_id)
+        for decrement, term_ids in by_decrement.items():
+            for chunk in chunked(term_ids, 500):
+                SearchTerm.objects.filter(pk__in=chunk).update(
+                    **{field: models.F(field) - decrement})
+        postings.delete()
+
+class Posting(models.Model):
+    """
+    An entry of the search index: ``term`` occurs ``frequency`` times in a
+    commit message (``document`` being the Commit id) or a file's content
+    (the BlobContent id).  ``weight`` is the score the term adds to the
+    document, before weighting by the term's rarity.
+    """
+    COMMIT = 'c'
+    CONTENT = 'b'
+    KIND_CHOICES = (
+        (COMMIT, 'Commit message'),
+        (CONTENT, 'File content'),
+    )
+    
+    term = models.ForeignKey(SearchTerm, related_name='postings')
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    document = models.IntegerField()
+    project = models.ForeignKey(Project, blank=True, null=True, related_name='postings')
+    frequency = models.IntegerField(default=1)
+    weight = models.FloatField(default=0)
+    
+    objects = PostingManager()
+    
+    class Meta:
+        unique_together = (('term', 'kind', 'document'),)
+    
+    def __unicode__(self):
+        return '%s in %s %s' % (self.term_id, self.kind, self.document)
@@ -0,0 +1,130 @@
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+GITHUB_PAGE_CACHE_TIMEOUT = getattr(settings, 'GITHUB_PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+def project_state(request, slug):
+    """
+    (latest commit sha, project modification time, latest commit date) for
+    the project, or None if there is no such project.  Looked up once per
+    request and shared by the page cache and the conditional GET headers.
+    """
+    from github.models import Project
+    if not hasattr(request, '_github_project_state'):
+        try:
+            request._github_project_state = Project.objects.filter(slug=slug) \
+                .values_list('latest_commit__sha', 'updated', 'latest_commit__created')[0]
+        except IndexError:
+            request._github_project_state = None
+    return request._github_project_state
+
+def project_list_state(request):
+    """
+    (number of projects, newest modification time)
+    """
+    from github.models import Project
+    if not hasattr(request, '_github_project_list_state'):
+        stats = Project.objects.aggregate(count=Count('id'), updated=Max('updated'))
+        request._github_project_list_state = (stats['count'], stats['updated'])
+    return request._github_project_list_state
+
+def blob_state(request, slug, path, sha=None):
+    """
+    (blob sha, commit sha, commit date, project modification time) for a
+    path in the project's latest commit, or in commit ``sha`` when given.  Only metadata
+    is read, never the blob's content.
+    """
+    from github.models import Blob
+    if not hasattr(request, '_github_blob_state'):
+        blobs = Blob.objects.filter(path=path)
+        if sha:
+            blobs = blobs.filter(commit__project__slug=slug, commit__sha=sha)
+        else:
+            blobs = blobs.filter(commit__latest_for__slug=slug)
+        try:
+            request._github_blob_state = blobs.values_list('sha', 'commit__sha',
+                'commit__created', 'commit__project__updated')[0]
+        except IndexError:
+            request._github_blob_state = None
+    return request._github_blob_state
+
+def timestamp(value):
+    return value and int(time.mktime(value.timetuple())) or 0
+
+def project_etag(request, slug, *args, **kwargs):
+    state = project_state(request, slug)
+    if state is None:
+        return None
+    sha, updated, created = state
+    return '%s-%d' % (sha or 'none', timestamp(updated))
+
+def project_last_modified(request, slug, *args, **kwargs):
+    state = project_state(request, slug)
+    if state is None:
+        return None
+    sha, updated, created = state
+    return max(filter(None, [updated, created]))
+
+def project_list_etag(request, *args, **kwargs):
+    count, updated = project_list_state(request)
+    return '%d-%d' % (count, timestamp(updated))
+
+def project_list_last_modified(request, *args, **kwargs):
+    count, updated = project_list_state(request)
+    return updated
+
+def blob_etag(request, slug, path, sha=None, **kwargs):
+    state = blob_state(request, slug, path, sha)
+    if state is None:
+        return None
+    # the page links to the commit it was rendered from, which can move on
+    # without the file changing
+    blob_sha, commit_sha, created, updated = state
+    return '%s-%s-%d' % (blob_sha, commit_sha, timestamp(updated))
+
+def blob_download_etag(request, slug, path, sha=None, **kwargs):
+    state = blob_state(request, slug, path, sha)
+    if state is None:
+        return None
+    # gzip and identity responses are different representations
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        return '%s-gzip' % state[0]
+    return state[0]
+
+def blob_last_modified(request, slug, path, sha=None, **kwargs):
+    state = blob_state(request, slug, path, sha)
+    if state is None:
+        return None
+    return state[2]
+
+def cache_project_page(view):
+    """
+    Cache successful GET responses of a view keyed by the project's slug and
+    version, so a sync or an edit moves the page to a fresh key instead of
+    waiting for a timeout.  Costs one query per hit, whatever the cache
+    backend.  Views without a slug are keyed by the whole project list.
+    """
+    def inner(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+        slug = args and args[0] or kwargs.get('slug')
+        if slug is None:
+            version = project_list_etag(request)
+        else:
+            version = project_etag(request, slug)
+            if version is None:
+                return view(request, *args, **kwargs)
+        key = 'github:page:%s:%s:%s' % (view.__name__, slug or '',
+            md5('%s:%s' % (version, request.get_full_path())).hexdigest())
+        response = cache.get(key)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response, GITHUB_PAGE_CACHE_TIMEOUT)
+        return response
+    return wraps(view)(inner)
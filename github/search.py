@@ -0,0 +1,157 @@
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from github.models import Blob, BlobContent, Commit, Posting, Project, SearchTerm
+from github.utils import tokenize
+
+GITHUB_SEARCH_COUNT_TIMEOUT = getattr(settings, 'GITHUB_SEARCH_COUNT_TIMEOUT', 60 * 60)
+
+KINDS = {
+    'commits': (Posting.COMMIT, 'commits', Commit),
+    'source': (Posting.CONTENT, 'contents', BlobContent),
+}
+
+def document_count(kind):
+    """
+    The number of documents of ``kind`` ('commits' or 'source'), which only
+    sets the scale of term weights and so is cached for an hour
+    """
+    key = 'github:search:count:%s' % kind
+    count = cache.get(key)
+    if count is None:
+        count = KINDS[kind][2].objects.count()
+        cache.set(key, count, GITHUB_SEARCH_COUNT_TIMEOUT)
+    return count
+
+class SearchResults(object):
+    """
+    The commits, or files of each project's latest commit, containing every
+    term of ``query``, best first, optionally within ``project``.  Scores
+    add up the weight of each posting times the rarity (idf) of its term.
+
+    Results are computed in the database a page at a time, so this is
+    meant to be handed to a Paginator: ``count()`` runs one query and each
+    slice one more, plus one to load the rows it names.  Source results
+    carry a ``snippet``, the first lines that mention a term.
+    """
+    def __init__(self, query, kind='source', project=None):
+        self.query = query
+        self.kind = kind
+        self.project = project
+        self.terms = list(set(tokenize(query)))
+        self._count = None
+        self._weights = None
+
+    def weights(self):
+        """
+        ``{term id: idf}``, or None if a term is in no document of the kind
+        """
+        if self._weights is None:
+            posting_kind, field, model = KINDS[self.kind]
+            rows = SearchTerm.objects.filter(term__in=self.terms).values_list('pk', field)
+            total = document_count(self.kind)
+            self._weights = dict((pk, math.log(1 + float(max(total, df)) / df))
+                                 for pk, df in rows if df)
+        if not self.terms or len(self._weights) < len(self.terms):
+            return None
+        return self._weights
+
+    def sql(self, weights, scored=False):
+        """
+        The query for the ids of matching documents, with their scores if
+        ``scored``, and its parameters
+        """
+        qn = connection.ops.quote_name
+        posting_kind, field, model = KINDS[self.kind]
+        params = []
+        if self.kind == 'commits':
+            key = 'p.%s' % qn('document')
+            joins = ''
+            scope = 'p.%s' % qn('project_id')
+        else:
+            key = 'b.%s' % qn('id')
+            joins = 'JOIN %s c ON c.%s = p.%s JOIN %s b ON b.%s = c.%s ' \
+                    'JOIN %s pr ON pr.%s = b.%s' % (
+                qn(BlobContent._meta.db_table), qn('id'), qn('document'),
+                qn(Blob._meta.db_table), qn('sha'), qn('sha'),
+                qn(Project._meta.db_table), qn('latest_commit_id'), qn('commit_id'))
+            scope = 'pr.%s' % qn('id')
+        select = key
+        if scored:
+            select += ', SUM(p.%s * CASE p.%s %s END) AS score' % (qn('weight'), qn('term_id'),
+                ' '.join(['WHEN %s THEN %s'] * len(weights)))
+            for pk, weight in weights.items():
+                params.extend([pk, weight])
+        params.append(posting_kind)
+        params.extend(weights.keys())
+        where = ''
+        if self.project:
+            where = 'AND %s = %%s' % scope
+            params.append(self.project.pk)
+        params.append(len(weights))
+        sql = 'SELECT %s FROM %s p %s WHERE p.%s = %%s AND p.%s IN (%s) %s ' \
+              'GROUP BY %s HAVING COUNT(*) = %%s' % (select, qn(Posting._meta.db_table), joins,
+            qn('kind'), qn('term_id'), ', '.join(['%s'] * len(weights)), where, key)
+        if scored:
+            sql += ' ORDER BY score DESC, %s DESC' % key
+        return sql, params
+
+    def count(self):
+        if self._count is None:
+            weights = self.weights()
+            if weights is None:
+                self._count = 0
+            else:
+                sql, params = self.sql(weights)
+                cursor = connection.cursor()
+                cursor.execute('SELECT COUNT(*) FROM (%s) matches' % sql, params)
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+        weights = self.weights()
+        start = k.start or 0
+        if weights is None or k.stop is not None and k.stop <= start:
+            return []
+        sql, params = self.sql(weights, scored=True)
+        if k.stop is not None:
+            sql += ' LIMIT %d' % (k.stop - start)
+        if start:
+            sql += ' OFFSET %d' % start
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        scores = cursor.fetchall()
+        if self.kind == 'commits':
+            objects = Commit.objects.select_related('project').in_bulk([pk for pk, s in scores])
+        else:
+            objects = Blob.objects.select_related('commit__project') \
+                .in_bulk([pk for pk, s in scores])
+            self.add_snippets(objects.values())
+        results = []
+        for pk, score in scores:
+            if pk in objects:
+                objects[pk].score = score
+                results.append(objects[pk])
+        return results
+
+    def add_snippets(self, blobs, lines=3):
+        contents = dict((content.sha, content) for content in
+                        BlobContent.objects.filter(sha__in=[b.sha for b in blobs]))
+        terms = set(self.terms)
+        for blob in blobs:
+            blob.snippet = []
+            if blob.sha not in contents:
+                continue
+            for line in contents[blob.sha].text.splitlines():
+                if terms.intersection(tokenize(line)):
+                    blob.snippet.append(line)
+                    if len(blob.snippet) >= lines:
+                        break
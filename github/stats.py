@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from github.libs.ratelimit import CacheBackend
+from github.libs.stats import BUCKETS, merge_snapshots
+
+GITHUB_STATS_TIMEOUT = getattr(settings, 'GITHUB_STATS_TIMEOUT', 60 * 60 * 24 * 7)
+STATS_KEY = 'github:stats'
+
+def publish(stats):
+    """
+    Move what ``stats`` recorded since it was last published into the totals
+    kept in the Django cache, where the github_stats command and the stats
+    view of other processes find them.  The cache must be shared between
+    processes (memcached, database) for syncs run by the management commands
+    to show up on the site.
+    """
+    snapshot = stats.snapshot(reset=True)
+    def _merge(state):
+        return merge_snapshots(state, snapshot), None
+    CacheBackend(timeout=GITHUB_STATS_TIMEOUT).update(STATS_KEY, _merge)
+
+def collect(stats=None):
+    """
+    The published totals, plus whatever ``stats`` has not published yet
+    """
+    totals = merge_snapshots({'buckets': list(BUCKETS)}, cache.get(STATS_KEY) or {})
+    if stats is not None:
+        merge_snapshots(totals, stats.snapshot())
+    return totals
+
+def clear(stats=None):
+    cache.delete(STATS_KEY)
+    if stats is not None:
+        stats.reset()
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import zlib
+from cStringIO import StringIO
+
+from django.conf import settings
+
+GITHUB_BLOB_STORAGE = getattr(settings, 'GITHUB_BLOB_STORAGE', 'db')
+GITHUB_BLOB_ROOT = getattr(settings, 'GITHUB_BLOB_ROOT',
+    os.path.join(settings.MEDIA_ROOT, 'github-blobs'))
+GITHUB_BLOB_COMPRESSION = getattr(settings, 'GITHUB_BLOB_COMPRESSION', 'gzip')
+GITHUB_BLOB_COMPRESS_MIN = getattr(settings, 'GITHUB_BLOB_COMPRESS_MIN', 256)
+
+def to_bytes(data):
+    if isinstance(data, unicode):
+        return data.encode('utf-8')
+    return data or ''
+
+def is_text(data):
+    """
+    Whether bytes can be kept in a text column as they are: valid UTF-8
+    with no NUL characters, which PostgreSQL refuses
+    """
+    if '\0' in data:
+        return False
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+def gzip_decompress(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+def identity(data):
+    return data
+
+# codec name -> (compress, decompress), both working on byte strings.  The
+# compressed bytes are kept base64-encoded since the column holds text;
+# 'base64' alone is for binary content that does not compress.
+CODECS = {
+    'gzip': (gzip_compress, gzip_decompress),
+    'base64': (identity, identity),
+}
+
+class DatabaseStorage(object):
+    """
+    Keeps blob content in the BlobContent.data column, compressed with
+    GITHUB_BLOB_COMPRESSION when that makes it smaller.  BlobContent.codec
+    records the codec used, '' meaning plain text.  Binary content is always
+    encoded, with 'base64' if compressing does not pay.
+    """
+    name = 'db'
+
+    def __init__(self, codec=GITHUB_BLOB_COMPRESSION, min_size=GITHUB_BLOB_COMPRESS_MIN):
+        self.codec = codec
+        self.min_size = min_size
+
+    def save(self, content, data):
+        raw = to_bytes(data)
+        if is_text(raw):
+            content.codec, content.data = '', data
+        else:
+            content.codec, content.data = 'base64', raw.encode('base64')
+        if self.codec and len(raw) >= self.min_size:
+            compress, decompress = CODECS[self.codec]
+            encoded = compress(raw).encode('base64')
+            if len(encoded) < len(content.data):
+                content.codec, content.data = self.codec, encoded
+
+    def compressed(self, content):
+        """
+        The compressed bytes of the content, or None if stored uncompressed
+        """
+        if not content.codec:
+            return None
+        return content.data.decode('base64')
+
+    def read(self, content):
+        if not content.codec:
+            return to_bytes(content.data)
+        compress, decompress = CODECS[content.codec]
+        return decompress(self.compressed(content))
+
+    def open(self, content):
+        return StringIO(self.read(content))
+
+    def delete(self, content):
+        content.codec, content.data = '', ''
+
+class FileSystemStorage(object):
+    """
+    Keeps blob content in files under ``root``, named by sha and fanned out
+    over subdirectories by the sha's first two characters
+    """
+    name = 'fs'
+
+    def __init__(self, root=GITHUB_BLOB_ROOT):
+        self.root = root
+
+    def relative_path(self, sha):
+        return '%s/%s' % (sha[:2], sha)
+
+    def path(self, sha):
+        return os.path.join(self.root, sha[:2], sha)
+
+    def save(self, content, data):
+        path = self.path(content.sha)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by a concurrent sync
+                pass
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        fh = os.fdopen(fd, 'wb')
+        try:
+            fh.write(to_bytes(data))
+        finally:
+            fh.close()
+        os.rename(tmp, path)
+        content.codec, content.data = '', ''
+
+    def open(self, content):
+        return open(self.path(content.sha), 'rb')
+
+    def delete(self, content):
+        try:
+            os.remove(self.path(content.sha))
+        except OSError:
+            pass
+
+STORAGES = {
+    DatabaseStorage.name: DatabaseStorage(),
+    FileSystemStorage.name: FileSystemStorage(),
+}
+
+def get_storage(name=GITHUB_BLOB_STORAGE):
+    return STORAGES[name]
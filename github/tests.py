@@ -0,0 +1,182 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase
+
+from github import utils
+from github.libs.fakehub import FakeHub, FakeRepo
+from github.libs.gitobjects import blob_sha
+from github.libs.pool import ConnectionPool
+from github.libs.ratelimit import TokenBucket
+from github.models import Blob, BlobContent, Commit, Directory, Posting, Project, \
+    github_client, GITHUB_LOGIN
+from github.utils import QueryBudgetExceeded, query_budget
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Every view is requested with GITHUB_ENFORCE_QUERY_BUDGET on, so one
+    going over the budget declared with ``query_budget`` fails the test
+    rather than logging a warning.  The project has enough commits, files
+    and directories for a query per row to show up.
+    """
+    urls = 'github.urls'
+
+    def setUp(self):
+        self._debug = settings.DEBUG
+        self._enforce = utils.GITHUB_ENFORCE_QUERY_BUDGET
+        settings.DEBUG = True
+        utils.GITHUB_ENFORCE_QUERY_BUDGET = True
+
+        self.project = Project.objects.create(title='Budget', github_repo='budget',
+                                              description='Query budgets')
+        Project.objects.create(title='Other', github_repo='other', description='Other')
+
+        commits = []
+        for i in range(5):
+            commits.append(Commit.objects.create(
+                project=self.project,
+                sha='%040x' % (i + 1),
+                tree='%040x' % (i + 100),
+                created=datetime.datetime(2010, 1, 1) + datetime.timedelta(days=i),
+                name='coleifer',
+                message='Commit %d fixes the parser' % i,
+                url='http://github.com/coleifer/budget/commit/%040x' % (i + 1),
+            ))
+        Posting.objects.index_commits(commits)
+        self.commit = commits[-1]
+
+        for i, path in enumerate(['', 'src/', 'src/lib/', 'docs/']):
+            Directory.objects.create(commit=self.commit, path=path, sha='%040x' % (i + 200))
+        contents = []
+        for i, path in enumerate(['README', 'src/a.py', 'src/b.py', 'src/lib/c.py',
+                                  'docs/index.rst']):
+            content = BlobContent(sha='%040x' % (i + 300), size=0, mime_type='text/plain')
+            content.store(u'%s calls the parser\n' % path * 20)
+            content.size = len(content.data)
+            content.save()
+            contents.append(content)
+            Blob.objects.create(commit=self.commit, name=path.split('/')[-1], path=path,
+                                size=content.size, mime_type=content.mime_type,
+                                sha=content.sha)
+        Posting.objects.index_contents(contents)
+
+        self.project.latest_commit = self.commit
+        self.project.save()
+
+    def tearDown(self):
+        settings.DEBUG = self._debug
+        utils.GITHUB_ENFORCE_QUERY_BUDGET = self._enforce
+
+    def test_views(self):
+        slug, sha = self.project.slug, self.commit.sha
+        urls = [
+            '/',
+            '/%s/' % slug,
+            '/%s/commits/' % slug,
+            '/%s/source/' % slug,
+            '/%s/source/src/' % slug,
+            '/%s/source/src/lib/' % slug,
+            '/%s/source/src/a.py' % slug,
+            '/%s/source/src/a.py/download/' % slug,
+            '/%s/commit/%s/source/src/a.py' % (slug, sha),
+            '/%s/commit/%s/source/src/a.py/download/' % (slug, sha),
+            '/search/?q=parser',
+            '/search/?q=parser&type=commits',
+            '/%s/search/?q=parser' % slug,
+            '/%s/search/?q=parser&type=commits' % slug,
+        ]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_budget_enforced(self):
+        @query_budget(1)
+        def view(request):
+            list(Project.objects.all())
+            list(Commit.objects.all())
+            return HttpResponse('')
+        self.assertRaises(QueryBudgetExceeded, view, None)
+
+class SyncTestCase(TestCase):
+    """
+    Syncs a repository served by FakeHub, through the API and from tarballs,
+    and checks both store the same rows and the files' exact bytes
+    """
+    def setUp(self):
+        self.repo = FakeRepo(files=40, depth=3, commits=3, binary=0.25, owner=GITHUB_LOGIN)
+        self.hub = FakeHub()
+        self.hub.add_repo('api', self.repo)
+        self.hub.add_repo('tarball', self.repo)
+        self.hub.start()
+        self._client = (github_client.api_root, github_client.gist_root,
+                        github_client.archive_root, github_client.pool,
+                        github_client.limiter, github_client.cache, github_client.credentials)
+        github_client.api_root = self.hub.api_root
+        github_client.gist_root = self.hub.gist_root
+        github_client.archive_root = self.hub.archive_root
+        github_client.pool = ConnectionPool()
+        github_client.limiter = TokenBucket(1e9, 5)
+        github_client.cache = None
+        github_client.credentials = None
+
+    def tearDown(self):
+        github_client.pool.clear()
+        (github_client.api_root, github_client.gist_root, github_client.archive_root,
+         github_client.pool, github_client.limiter, github_client.cache,
+         github_client.credentials) = self._client
+        self.hub.stop()
+
+    def sync(self, mode):
+        project, created = Project.objects.get_or_create(title=mode, github_repo=mode,
+                                                         defaults={'description': mode})
+        project.fetch_github(mode=mode)
+        return Project.objects.get(pk=project.pk).latest_commit
+
+    def rows(self, commit):
+        blobs = sorted(commit.blobs.values_list('path', 'sha', 'size', 'mime_type', 'directory'))
+        directories = sorted(commit.directories.values_list('path', 'sha', 'name', 'parent',
+                                                            'complete'))
+        return blobs, directories
+
+    def assertContentMatches(self, commit):
+        for blob in commit.blobs.all():
+            content = BlobContent.objects.get(sha=blob.sha)
+            self.assertEqual(blob_sha(content.read()), blob.sha, blob.path)
+            self.assertEqual(content.size, blob.size, blob.path)
+
+    def assertMatchesRepo(self, commit):
+        tree = self.repo.commits[0]['tree']
+        expected = sorted([(path, blob['sha']) for path, blob in self.repo.walk(tree)])
+        self.assertEqual(sorted(commit.blobs.values_list('path', 'sha')), expected)
+        self.assertEqual(commit.directories.get(path='').sha, tree)
+        self.assertTrue(commit.is_synced())
+
+    def test_api(self):
+        commit = self.sync('api')
+        self.assertMatchesRepo(commit)
+        self.assertContentMatches(commit)
+        self.assertTrue(commit.blobs.filter(mime_type='image/png').count())
+
+    def test_tarball(self):
+        commit = self.sync('tarball')
+        self.assertMatchesRepo(commit)
+        self.assertContentMatches(commit)
+        self.assertEqual(self.hub.requests.get('tarball'), 1)
+        self.assertFalse(self.hub.requests.get('blob'))
+
+    def test_modes_agree(self):
+        self.assertEqual(self.rows(self.sync('tarball')), self.rows(self.sync('api')))
+
+    def test_carry_forward(self):
+        first = self.sync('api')
+        self.repo.commit(changes=2)
+        self.hub.reset()
+        commit = self.sync('api')
+        self.assertNotEqual(commit.pk, first.pk)
+        self.assertMatchesRepo(commit)
+        self.assertContentMatches(commit)
+        # only the trees leading to the two changed files are walked
+        self.assertTrue(self.hub.requests.get('tree', 0) < commit.directories.count())
+        self.assertTrue(self.hub.requests.get('blob', 0) <= 2)
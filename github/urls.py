@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.conf.urls.defaults import *
 
+GITHUB_STATS_VIEW = getattr(settings, 'GITHUB_STATS_VIEW', False)
+
 urlpatterns = patterns('github.views',
     url(r'^$', 
         view='project_list', 
@@ -9,14 +12,30 @@ urlpatterns = patterns('github.views',
         view='github_hook',
         name='project_github_hook'
     ),
+    url(r'^search/$',
+        view='search',
+        name='github_search'
+    ),
     url(r'^([\w-]+)/$', 
         view='project_detail', 
         name='project_detail'
     ),
+    url(r'^([\w-]+)/search/$',
+        view='search',
+        name='project_search'
+    ),
     url(r'^([\w-]+)/commits/$',
         view='commit_list',
         name='commit_list'
     ),
+    url(r'^([\w-]+)/commit/([0-9a-f]{40})/source/(.+)/download/$',
+        view='blob_download_at',
+        name='blob_download_at'
+    ),
+    url(r'^([\w-]+)/commit/([0-9a-f]{40})/source/(.+)',
+        view='blob_detail_at',
+        name='blob_detail_at'
+    ),
     url(r'^([\w-]+)/source/$',
         view='blob_list', 
         name='blob_list'
@@ -25,8 +44,20 @@ urlpatterns = patterns('github.views',
         view='blob_download',
         name='blob_download'
     ),
+    url(r'^([\w-]+)/source/(.+/)$',
+        view='blob_list',
+        name='blob_tree'
+    ),
     url(r'^([\w-]+)/source/(.+)', 
         view='blob_detail',
         name='blob_detail'
     ),
 )
+
+if GITHUB_STATS_VIEW:
+    urlpatterns += patterns('github.views',
+        url(r'^stats\.json$',
+            view='stats',
+            name='github_stats'
+        ),
+    )
@@ -0,0 +1,113 @@
+import logging
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import AutoField
+
+GITHUB_ENFORCE_QUERY_BUDGET = getattr(settings, 'GITHUB_ENFORCE_QUERY_BUDGET', False)
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def query_budget(max_queries):
+    """
+    Declare the most queries a view may run.  While ``settings.DEBUG`` is on
+    every call is counted; going over the budget logs a warning, or raises
+    QueryBudgetExceeded when ``GITHUB_ENFORCE_QUERY_BUDGET`` is set, as a test
+    settings module should do.  The budget is kept on the view as
+    ``view.query_budget``.
+    """
+    def decorator(view):
+        def inner(request, *args, **kwargs):
+            if not settings.DEBUG:
+                return view(request, *args, **kwargs)
+            start = len(connection.queries)
+            response = view(request, *args, **kwargs)
+            used = len(connection.queries) - start
+            if used > max_queries:
+                message = '%s ran %d queries, budget is %d' % (view.__name__, used, max_queries)
+                if GITHUB_ENFORCE_QUERY_BUDGET:
+                    raise QueryBudgetExceeded(message)
+                logging.warning(message)
+            return response
+        inner.query_budget = max_queries
+        return wraps(view)(inner)
+    return decorator
+
+def configure_logging(verbose=False):
+    """
+    Log everything to github_log.log, and INFO and up to the console as
+    well when ``verbose``, as the management commands do
+    """
+    logging.basicConfig(
+        filename='github_log.log',
+        level=logging.DEBUG,
+        format='%(asctime)s %(levelname)-8s %(message)s',
+    )
+    if verbose:
+        console = logging.StreamHandler()
+        console.setLevel(logging.INFO)
+        formatter = logging.Formatter('%(name)-12s: %(levelname)-8s %(message)s')
+        console.setFormatter(formatter)
+        logging.getLogger('').addHandler(console)
+
+def chunked(seq, size):
+    """
+    Split a sequence into lists of at most ``size`` items
+    """
+    seq = list(seq)
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+def parent_path(path):
+    """
+    The directory containing a blob or directory path, with a trailing slash
+    ('' for the root): 'src/a.py' and 'src/sub/' both give 'src/'
+    """
+    return path[:path.rstrip('/').rfind('/') + 1]
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text, max_length=64):
+    """
+    The search terms in ``text``: its words, lowercased, plus the parts of
+    words joined by underscores, so ``fetch_github`` is also found by
+    ``github``.  Single characters and words over ``max_length`` are left
+    out.
+    """
+    for word in WORD.findall(text.lower()):
+        parts = [part for part in word.split('_') if part]
+        if len(parts) > 1:
+            parts.insert(0, word)
+        for part in parts:
+            if 1 < len(part) <= max_length:
+                yield part
+
+def total_seconds(delta):
+    """
+    The length of a timedelta in seconds
+    """
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+def bulk_insert(objects, batch_size=100):
+    """
+    Insert unsaved model instances of one model with a single ``executemany``
+    per batch.  ``save()`` is bypassed, so no signals are sent and primary
+    keys are not set on the instances.  Call it inside a transaction.
+    """
+    if not objects:
+        return
+    opts = objects[0]._meta
+    fields = [f for f in opts.local_fields if not isinstance(f, AutoField)]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(opts.db_table),
+        ', '.join([qn(f.column) for f in fields]),
+        ', '.join(['%s'] * len(fields)))
+    cursor = connection.cursor()
+    for chunk in chunked(objects, batch_size):
+        cursor.executemany(sql, [
+            [f.get_db_prep_save(f.pre_save(obj, True)) for f in fields]
+            for obj in chunk])
+    transaction.set_dirty()
@@ -1,12 +1,57 @@
+try:
+    import simplejson
+except ImportError:
+    import json as simplejson
+import os
+
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import EmptyPage, InvalidPage, Paginator
+from django.core.servers.basehttp import FileWrapper
 from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
 from django.views.generic import list_detail
-from github.models import Project, Blob
+from github.models import Project, Blob, SyncJob, github_client
+from github.pagecache import cache_project_page, project_etag, project_last_modified, \
+    project_list_etag, project_list_last_modified, blob_etag, blob_download_etag, \
+    blob_last_modified
+from github.search import SearchResults
+from github.stats import collect
+from github.storage import FileSystemStorage, get_storage
+from github.utils import parent_path, query_budget
 
 SECRET_KEY = getattr(settings, 'SECRET_KEY', '1337')
+GITHUB_SENDFILE_HEADER = getattr(settings, 'GITHUB_SENDFILE_HEADER', None)
+GITHUB_SENDFILE_URL = getattr(settings, 'GITHUB_SENDFILE_URL', '/github-blobs/')
+GITHUB_CHUNK_SIZE = getattr(settings, 'GITHUB_CHUNK_SIZE', 8192)
+GITHUB_PINNED_MAX_AGE = getattr(settings, 'GITHUB_PINNED_MAX_AGE', 60 * 60 * 24 * 365)
+
+def get_commit(project, sha=None):
+    """
+    The commit ``sha`` of the project, or its latest commit
+    """
+    if sha:
+        return get_object_or_404(project.commits.all(), sha=sha)
+    latest_commit = project.get_latest_commit()
+    if not latest_commit:
+        raise Http404
+    return latest_commit
 
+def pin(response):
+    """
+    Let browsers and proxies keep responses for a URL naming a commit sha,
+    which can never change
+    """
+    if response.status_code in (200, 304):
+        patch_cache_control(response, public=True, max_age=GITHUB_PINNED_MAX_AGE)
+    return response
+
+@condition(project_list_etag, project_list_last_modified)
+@cache_project_page
+@query_budget(2)
 def project_list(request, paginate_by=20, **kwargs):
     return list_detail.object_list(
         request,
@@ -16,6 +61,9 @@ def project_list(request, paginate_by=20, **kwargs):
         **kwargs
     )
 
+@condition(project_etag, project_last_modified)
+@cache_project_page
+@query_budget(1)
 def project_detail(request, slug, **kwargs):
     return list_detail.object_detail(
         request,
@@ -25,11 +73,14 @@ def project_detail(request, slug, **kwargs):
         template_object_name='project',
     )
 
+@condition(project_etag, project_last_modified)
+@cache_project_page
+@query_budget(3)
 def commit_list(request, slug, paginate_by=20, template_name='github/commit_list.html', **kwargs):
     project = get_object_or_404(Project, slug=slug)
     return list_detail.object_list(
         request,
-        queryset=project.commits.all(),
+        queryset=project.commits.select_related('project'),
         extra_context={'project': project},
         template_name=template_name,
         paginate_by=paginate_by,
@@ -37,47 +88,130 @@ def commit_list(request, slug, paginate_by=20, template_name='github/commit_list
         **kwargs
     )
 
-def blob_list(request, slug, template_name='github/blob_list.html', **kwargs):
-    project = get_object_or_404(Project, slug=slug)
+@condition(project_etag, project_last_modified)
+@cache_project_page
+@query_budget(4)
+def blob_list(request, slug, path='', template_name='github/blob_list.html', **kwargs):
+    """
+    One directory level of the latest commit's tree: its subdirectories and
+    the metadata of its files, never their content
+    """
+    project = get_object_or_404(Project.objects.select_related('latest_commit'), slug=slug)
     latest_commit = project.get_latest_commit()
     if not latest_commit:
         raise Http404
+    if path and not latest_commit.directories.filter(path=path).count():
+        raise Http404
     return list_detail.object_list(
         request,
-        queryset=latest_commit.blobs.all(),
-        extra_context={'project': project, 'commit': latest_commit},
+        queryset=latest_commit.blobs.filter(directory=path).only('name', 'path', 'size'),
+        extra_context={
+            'project': project,
+            'commit': latest_commit,
+            'path': path,
+            'parent': parent_path(path),
+            'directories': latest_commit.directories.filter(parent=path).exclude(path='') \
+                .only('name', 'path'),
+        },
         template_name=template_name,
         **kwargs
     )
 
-def blob_detail(request, slug, path, template_name='github/blob_detail.html', **kwargs):
-    project = get_object_or_404(Project, slug=slug)
-    latest_commit = project.get_latest_commit()
-    blob = get_object_or_404(latest_commit.blobs.all(), path=path)
-    if not latest_commit:
-        raise Http404
+@condition(blob_etag, blob_last_modified)
+@cache_project_page
+@query_budget(4)
+def blob_detail(request, slug, path, sha=None, template_name='github/blob_detail.html', **kwargs):
+    project = get_object_or_404(Project.objects.select_related('latest_commit'), slug=slug)
+    commit = get_commit(project, sha)
+    blob = get_object_or_404(commit.blobs.all(), path=path)
     return render_to_response(template_name, 
-            { 'object': blob, 'project': project, 'commit': latest_commit }, 
+            { 'object': blob, 'project': project, 'commit': commit, 'pinned': bool(sha) }, 
             context_instance=RequestContext(request))
 
-def blob_download(request, slug, path):
-    project = get_object_or_404(Project, slug=slug)
-    latest_commit = project.get_latest_commit()
-    blob = get_object_or_404(latest_commit.blobs.all(), path=path)
-    response = HttpResponse(blob.data, blob.mime_type)
+def blob_detail_at(request, slug, sha, path, **kwargs):
+    return pin(blob_detail(request, slug, path, sha=sha, **kwargs))
+
+@condition(blob_download_etag, blob_last_modified)
+@query_budget(4)
+def blob_download(request, slug, path, sha=None):
+    project = get_object_or_404(Project.objects.select_related('latest_commit'), slug=slug)
+    commit = get_commit(project, sha)
+    blob = get_object_or_404(commit.blobs.all(), path=path)
+    content = blob.content
+    if content is None:
+        raise Http404
+    if content.storage == FileSystemStorage.name:
+        storage = get_storage(content.storage)
+        if GITHUB_SENDFILE_HEADER == 'X-Accel-Redirect':
+            response = HttpResponse('', blob.mime_type)
+            response[GITHUB_SENDFILE_HEADER] = GITHUB_SENDFILE_URL + storage.relative_path(content.sha)
+        elif GITHUB_SENDFILE_HEADER:
+            response = HttpResponse('', blob.mime_type)
+            response[GITHUB_SENDFILE_HEADER] = storage.path(content.sha)
+        else:
+            fh = content.open()
+            response = HttpResponse(FileWrapper(fh, GITHUB_CHUNK_SIZE), blob.mime_type)
+            response['Content-Length'] = str(os.fstat(fh.fileno()).st_size)
+    else:
+        # gzip-compressed rows go out as they are to clients that accept it
+        storage = get_storage(content.storage)
+        if content.codec == 'gzip' and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(storage.compressed(content), blob.mime_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(storage.read(content), blob.mime_type)
+        response['Content-Length'] = str(len(response.content))
+        patch_vary_headers(response, ('Accept-Encoding',))
     response['Content-Disposition'] = 'attachment; filename=%s' % (blob.name)
     return response
 
+def blob_download_at(request, slug, sha, path):
+    return pin(blob_download(request, slug, path, sha=sha))
+
+@query_budget(7)
+def search(request, slug=None, paginate_by=20, template_name='github/search.html'):
+    """
+    Ranked search of the files of each project's latest commit, or of commit
+    messages with ``type=commits``, in one project or in all of them
+    """
+    project = None
+    if slug:
+        project = get_object_or_404(Project, slug=slug)
+    query = request.GET.get('q', '').strip()
+    kind = request.GET.get('type') == 'commits' and 'commits' or 'source'
+    paginator = Paginator(SearchResults(query, kind, project), paginate_by)
+    try:
+        page = paginator.page(int(request.GET.get('page', 1)))
+    except (ValueError, EmptyPage, InvalidPage):
+        raise Http404
+    return render_to_response(template_name,
+            { 'project': project, 'query': query, 'kind': kind,
+              'paginator': paginator, 'page': page },
+            context_instance=RequestContext(request))
+
 def github_hook(request, secret_key):
+    """
+    Queue a sync of the pushed project; the sync itself is run by the
+    process_sync_jobs command so the hook can answer straight away
+    """
     if secret_key != SECRET_KEY:
         raise Http404
     if request.method == 'POST':
         try:
-            data = simplejson.loads(request.POST)
+            data = simplejson.loads(request.POST['payload'])
             repo = data['repository']['name']
             project = Project.objects.get(github_repo=repo)
-            project.fetch_github()
+            SyncJob.objects.enqueue(project)
             return HttpResponse('OK')
         except:
             pass
     return HttpResponse('')
+
+@staff_member_required
+def stats(request):
+    """
+    The sync stats as JSON: what every process has published, plus this
+    process's own.  Only routed when GITHUB_STATS_VIEW is set.
+    """
+    return HttpResponse(simplejson.dumps(collect(github_client.stats)),
+                        mimetype='application/json')